@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Size and speed of the SequenceFile compression settings.
+
+Converts a synthetic exodus file with exodus2seq_convert.convert() under
+every --compression type and reports the bytes written, the
+time to write (encode) and the time to read back (decode) the dataset.
+
+example:
+python benchmarks/bench_compression.py --nodes 20000 --steps 50 -t 10
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import exodus2seq as ex
+from exodus2seq_convert import convert
+from synthetic import write_exodus
+
+from hadoop.io import SequenceFile
+from hadoop.typedbytes import *
+
+def dataset_bytes(outdir):
+    return sum([os.path.getsize(os.path.join(outdir, fname))
+        for fname in os.listdir(outdir)])
+
+def read_dataset(outdir):
+    """ Decode every record of every sequence file in outdir. """
+    nrecords = 0
+    key = TypedBytesWritable()
+    value = TypedBytesWritable()
+    for fname in sorted(os.listdir(outdir)):
+        if not fname.endswith('.seq'):
+            continue
+        reader = SequenceFile.Reader(os.path.join(outdir, fname))
+        while reader.next(key, value):
+            key.get()
+            value.get()
+            nrecords += 1
+        reader.close()
+    return nrecords
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--nodes', dest='nodes', type='int', default=20000,
+        help='number of nodes of the synthetic file')
+    parser.add_option('--steps', dest='steps', type='int', default=50,
+        help='number of time steps of the synthetic file')
+    parser.add_option('--variables', dest='variables', type='int', default=2,
+        help='number of node variables of the synthetic file')
+    parser.add_option('-t', '--timesteps', dest='timesteps', type='int', default=10,
+        help='number of time steps per part file')
+    parser.add_option('--encoding', dest='encoding', default='plain',
+        type='choice', choices=list(ex.ENCODINGS),
+        help='encoding of the node values')
+    options, args = parser.parse_args()
+    
+    tmpdir = tempfile.mkdtemp(prefix='bench_compression')
+    try:
+        exofile = os.path.join(tmpdir, 'synthetic.e')
+        names = write_exodus(exofile, options.nodes, options.steps, options.variables)
+        variables = ','.join(names)
+        
+        print '%-8s %12s %10s %10s' % ('type', 'bytes', 'encode s', 'decode s')
+        for compression in ('none', 'record', 'block'):
+            outdir = os.path.join(tmpdir, compression)
+            os.mkdir(outdir)
+            t0 = time.time()
+            convert(exofile, options.timesteps, outdir, variables,
+                encoding=options.encoding, compression=compression)
+            tencode = time.time() - t0
+            t0 = time.time()
+            read_dataset(outdir)
+            tdecode = time.time() - t0
+            print '%-8s %12i %10.3f %10.3f' % (compression,
+                dataset_bytes(outdir), tencode, tdecode)
+            shutil.rmtree(outdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+End to end benchmark of the local converter.
+
+Writes a synthetic exodus file of every size in --sizes with
+exopy2.write_synthetic(), converts it with exodus2seq_convert.convert()
+as the local runner does, and reports for every size
+
+    MB/s        the node values of the exodus file per second
+    steps/s     the time steps per second
+    peak RSS    the peak resident memory of the conversion
+    out bytes   the bytes of the dataset
+
+with the seconds of the stages of the conversion from its Stats.  Every
+conversion runs in a new python process, so the peak RSS is that of one
+conversion and no cache of an earlier one is warm.  The options of the
+converter are passed after --, as to exodus2seq_convert.py, without -d
+and --variables.
+
+--output saves the results with the git revision, the host and the
+python and numpy versions to a JSON file, --compare prints the ratios
+of the results to those of an earlier one:
+
+python benchmarks/bench_convert.py --sizes 10000x50x2,100000x50x4 --output old.json -- -t 10
+python benchmarks/bench_convert.py --compare old.json --output new.json -- -t 10
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import resource
+import tempfile
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import exopy2 as ep
+import exodus2seq_convert as ec
+
+DEFAULT_SIZES = '10000x50x2,50000x50x4,200000x20x4'
+
+def parse_sizes(sizes):
+    """ Parse a comma delimited list of NODESxSTEPSxVARS sizes.
+
+    @return a list of (nodes, steps, vars) tuples
+    @raise ValueError if a size is not three positive integers
+    """
+    parsed = []
+    for size in sizes.split(','):
+        values = tuple([int(v) for v in size.strip().split('x')])
+        if len(values) != 3 or min(values) < 1:
+            raise ValueError('invalid size %s'%(size))
+        parsed.append(values)
+    return parsed
+
+def dir_bytes(dirname):
+    total = 0
+    for path, dirs, files in os.walk(dirname):
+        total += sum([os.path.getsize(os.path.join(path, f)) for f in files])
+    return total
+
+def git_revision():
+    """ The git revision of the tree, None outside a git checkout. """
+    try:
+        p = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out = p.communicate()[0]
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    return out.strip()
+
+def run_case(exofile, outdir, names, args):
+    """ Convert exofile in this process, the single run of a child.
+
+    @param args the converter options
+    @return a dict of the results
+    """
+    parser = OptionParser()
+    ec.add_options(parser.add_option)
+    options, rest = parser.parse_args(args + ['-d', outdir, '--variables', names])
+    steps, outdir, variables, kwargs = ec.load_options(options, parser.error)
+    stats = ec.Stats()
+    t0 = time.time()
+    if not ec.convert(exofile, steps, outdir, variables, subdir=True,
+            stats=stats, **kwargs):
+        raise IOError('the conversion of %s did not run'%(exofile))
+    seconds = time.time() - t0
+    # kilobytes on linux, bytes on mac os x
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+    return dict(seconds=seconds, peak_rss_kb=maxrss,
+        out_bytes=dir_bytes(os.path.join(outdir, ec.dataset_name(exofile))),
+        stats=stats.to_dict())
+
+def run_child(exofile, outdir, names, args):
+    """ Run a conversion in a new python process. """
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case', exofile,
+        '--case-dir', outdir, '--case-variables', names, '--'] + args
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        raise RuntimeError('%s failed with status %i'%(' '.join(cmd), p.returncode))
+    return json.loads(out.strip().splitlines()[-1])
+
+def case_key(case):
+    return '%(nodes)ix%(steps)ix%(vars)i/%(word_size)i'%(case)
+
+def benchmark(sizes, args, word_size=8, repeat=1, tmpdir=None):
+    """ Benchmark the conversion of a synthetic file of every size.
+
+    @param sizes a list of (nodes, steps, vars) tuples
+    @param args the converter options
+    @param repeat convert every file this many times and keep the
+        fastest run
+    @return a list of dicts of the results
+    """
+    tmpdir = tempfile.mkdtemp(prefix='bench_convert', dir=tmpdir)
+    cases = []
+    try:
+        for nodes, steps, nvars in sizes:
+            exofile = os.path.join(tmpdir, 'synthetic%ix%ix%i.e'%(nodes, steps, nvars))
+            names = ','.join(ep.write_synthetic(exofile, nodes, steps, nvars, word_size))
+            best = None
+            for i in xrange(repeat):
+                outdir = os.path.join(tmpdir, 'out')
+                os.mkdir(outdir)
+                run = run_child(exofile, outdir, names, args)
+                shutil.rmtree(outdir)
+                if best is None or run['seconds'] < best['seconds']:
+                    best = run
+            os.remove(exofile)
+            case = dict(nodes=nodes, steps=steps, vars=nvars, word_size=word_size)
+            case.update(best)
+            case['mb_per_s'] = nodes*steps*nvars*word_size/1e6/best['seconds']
+            case['steps_per_s'] = steps/best['seconds']
+            cases.append(case)
+    finally:
+        shutil.rmtree(tmpdir)
+    return cases
+
+def print_cases(cases, old=None):
+    """ Print the results, with the ratios to the cases of old. """
+    olds = dict([(case_key(case), case) for case in old or []])
+    print '%-22s %9s %9s %9s %11s %12s' % ('nodes x steps x vars', 'seconds',
+        'MB/s', 'steps/s', 'peak RSS MB', 'out bytes')
+    for case in cases:
+        print '%-22s %9.3f %9.1f %9.1f %11.1f %12i' % (case_key(case),
+            case['seconds'], case['mb_per_s'], case['steps_per_s'],
+            case['peak_rss_kb']/1024., case['out_bytes'])
+        stages = case['stats']['seconds']
+        print '    ' + ' '.join(['%s %.3f'%(stage, stages[stage])
+            for stage in sorted(stages)])
+        if case_key(case) in olds:
+            prev = olds[case_key(case)]
+            print '    vs old: MB/s x%.3f, peak RSS x%.3f, out bytes x%.3f' % (
+                case['mb_per_s']/prev['mb_per_s'],
+                float(case['peak_rss_kb'])/prev['peak_rss_kb'],
+                float(case['out_bytes'])/prev['out_bytes'])
+
+def main():
+    parser = OptionParser(usage='%prog [options] [-- CONVERTER OPTIONS]')
+    parser.add_option('--sizes', dest='sizes', default=DEFAULT_SIZES,
+        help='comma delimited NODESxSTEPSxVARS sizes of the synthetic files (default %s)'%(DEFAULT_SIZES))
+    parser.add_option('--word-size', dest='word_size', type='int', default=8,
+        help='floating point word size of the synthetic files, 4 or 8')
+    parser.add_option('--repeat', dest='repeat', type='int', default=1,
+        help='convert every file NUM times and keep the fastest run')
+    parser.add_option('--tmpdir', dest='tmpdir',
+        help='write the synthetic files and the datasets into a directory of DIR')
+    parser.add_option('--output', dest='output',
+        help='save the results to the JSON file FILE')
+    parser.add_option('--compare', dest='compare',
+        help='compare the results to those saved in the JSON file FILE')
+    parser.add_option('--run-case', dest='run_case', help=SUPPRESS_HELP)
+    parser.add_option('--case-dir', dest='case_dir', help=SUPPRESS_HELP)
+    parser.add_option('--case-variables', dest='case_variables', help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.run_case is not None:
+        print json.dumps(run_case(options.run_case, options.case_dir,
+            options.case_variables, args))
+        return 0
+
+    try:
+        sizes = parse_sizes(options.sizes)
+    except ValueError:
+        parser.error('Invalid --sizes %s'%(options.sizes))
+    if options.word_size not in (4, 8):
+        parser.error('--word-size must be 4 or 8')
+    if options.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    if '-t' not in args and '--timesteps' not in args and '--part-bytes' not in args:
+        args = ['-t', '10'] + args
+    old = None
+    if options.compare is not None:
+        f = open(options.compare)
+        try:
+            old = json.load(f)
+        finally:
+            f.close()
+        if old.get('args') != args:
+            print >> sys.stderr, 'warning: %s was run with the converter options %s'%(
+                options.compare, ' '.join(old.get('args', [])))
+
+    cases = benchmark(sizes, args, options.word_size, options.repeat, options.tmpdir)
+    if old is not None:
+        print 'old: %s %s'%(old.get('git'), old.get('date'))
+    print_cases(cases, old and old['cases'])
+
+    if options.output is not None:
+        results = dict(git=git_revision(),
+            date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            host=socket.gethostname(), platform=platform.platform(),
+            python=platform.python_version(), numpy=np.__version__,
+            args=args, repeat=options.repeat, cases=cases)
+        f = open(options.output, 'w')
+        try:
+            json.dump(results, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
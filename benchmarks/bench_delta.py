@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Size and speed of the delta encoding.
+
+Converts an exodus file with exodus2seq_convert.convert() in the plain
+and the packed encoding, and packed with --shuffle, --delta and both,
+then reports the bytes written, the time to write (encode) and the time
+to read the node values back into arrays with
+exodus2seq_reader.Dataset.iter_blocks() (decode).  The values read back
+are checked to be exactly those of the packed dataset.
+
+Without --exodus the file is synthetic, pass one of your own files to see
+how its fields difference.
+
+example:
+python benchmarks/bench_delta.py --nodes 20000 --steps 50 -t 10
+python benchmarks/bench_delta.py --exodus run1.e --variables TEMP -t 10
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import exodus2seq as ex
+from exodus2seq_reader import Dataset
+from exodus2seq_convert import convert
+from synthetic import write_exodus
+
+SETTINGS = [
+    ('plain', dict(encoding='plain')),
+    ('packed', dict(encoding='packed')),
+    ('shuffle', dict(encoding='packed', shuffle=True)),
+    ('delta', dict(encoding='packed', delta=True)),
+    ('delta+shuffle', dict(encoding='packed', delta=True, shuffle=True)),
+]
+
+def dataset_bytes(outdir):
+    return sum([os.path.getsize(os.path.join(outdir, fname))
+        for fname in os.listdir(outdir)])
+
+def read_blocks(outdir):
+    """ Read the values with iter_blocks(). """
+    values = {}
+    for block in Dataset(outdir).iter_blocks():
+        for name, data in block.values:
+            values.setdefault(name, []).append(data)
+    return dict([(name, np.concatenate(blocks)) for name, blocks in values.items()])
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--exodus', dest='exodus',
+        help='the exodus file to convert instead of a synthetic one')
+    parser.add_option('--variables', dest='variables',
+        help='comma delimited node variables of --exodus')
+    parser.add_option('--nodes', dest='nodes', type='int', default=20000,
+        help='number of nodes of the synthetic file')
+    parser.add_option('--steps', dest='steps', type='int', default=50,
+        help='number of time steps of the synthetic file')
+    parser.add_option('--num-variables', dest='num_variables', type='int', default=2,
+        help='number of node variables of the synthetic file')
+    parser.add_option('-t', '--timesteps', dest='timesteps', type='int', default=10,
+        help='number of time steps per part file')
+    parser.add_option('--compression', dest='compression', default='record',
+        type='choice', choices=sorted(ex.COMPRESSION_TYPES),
+        help='the SequenceFile compression')
+    options, args = parser.parse_args()
+    if options.exodus is not None and options.variables is None:
+        parser.error('You must specify the --variables of --exodus')
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_delta')
+    try:
+        if options.exodus is None:
+            exofile = os.path.join(tmpdir, 'synthetic.e')
+            variables = ','.join(write_exodus(exofile, options.nodes,
+                options.steps, options.num_variables))
+        else:
+            exofile = options.exodus
+            variables = options.variables
+
+        print '%-14s %12s %8s %10s %10s' % ('encoding', 'bytes', 'ratio', 'encode s', 'decode s')
+        packed = None
+        plain_bytes = None
+        for label, kwargs in SETTINGS:
+            outdir = os.path.join(tmpdir, label)
+            os.mkdir(outdir)
+            t0 = time.time()
+            convert(exofile, options.timesteps, outdir, variables,
+                compression=options.compression, **kwargs)
+            tencode = time.time() - t0
+            t0 = time.time()
+            values = read_blocks(outdir)
+            tdecode = time.time() - t0
+            nbytes = dataset_bytes(outdir)
+            if plain_bytes is None:
+                plain_bytes = nbytes
+            if label == 'packed':
+                packed = values
+            elif packed is not None:
+                for name in packed:
+                    assert packed[name].tostring() == values[name].tostring(), name
+            print '%-14s %12i %8.3f %10.3f %10.3f' % (label, nbytes,
+                float(nbytes)/plain_bytes, tencode, tdecode)
+            shutil.rmtree(outdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
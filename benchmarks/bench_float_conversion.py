@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the float conversion in convert().
+
+To avoid the PICKLE type code every numpy value has to be turned into a
+python float before it is handed to typedbytes.  This compares the old
+per element float() loop with the tolist() conversion now used by
+exodus2seq_convert.convert() and checks that both give the same values.
+
+example:
+python benchmarks/bench_float_conversion.py --nodes 100000 --steps 20
+"""
+
+import sys
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+def loop_convert(block):
+    """ The old conversion: one float() call per element. """
+    rows = []
+    for data in block:
+        data2 = []
+        for m, ele in enumerate(data):
+            data2.append(float(ele))
+        rows.append(data2)
+    return rows
+
+def tolist_convert(block):
+    """ The new conversion: one tolist() call per partition. """
+    return block.tolist()
+
+def best_time(func, arg, repeat):
+    best = None
+    for r in xrange(repeat):
+        t0 = time.time()
+        func(arg)
+        t = time.time() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--nodes', dest='nodes', type='int', default=100000,
+        help='number of nodes per time step')
+    parser.add_option('--steps', dest='steps', type='int', default=10,
+        help='number of time steps in a partition')
+    parser.add_option('--repeat', dest='repeat', type='int', default=3,
+        help='report the best of REPEAT runs')
+    options, args = parser.parse_args()
+    
+    for dtype in (np.float64, np.float32):
+        block = np.random.rand(options.steps, options.nodes).astype(dtype)
+        
+        a = loop_convert(block)
+        b = tolist_convert(block)
+        if a != b or type(b[0][0]) is not float:
+            print >> sys.stderr, 'tolist() does not match the float() loop for', np.dtype(dtype).name
+            return 1
+        
+        tloop = best_time(loop_convert, block, options.repeat)
+        ttolist = best_time(tolist_convert, block, options.repeat)
+        nvalues = options.steps * options.nodes
+        print '%-8s %i values  loop %8.3fs  tolist %8.3fs  speedup %6.1fx' % (
+            np.dtype(dtype).name, nvalues, tloop, ttolist, tloop/ttolist)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
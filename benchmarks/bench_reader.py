@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Read throughput of a converted dataset.
+
+Converts a synthetic exodus file with exodus2seq_convert.convert() in
+the plain and the packed encoding, then reads the node values back into
+(time steps x nodes) numpy arrays two ways: with generic typedbytes
+decoding, collecting the values of every record in python lists, and
+with exodus2seq_reader.Dataset.iter_blocks().  Reports the seconds and
+the MB/s of node values for both.
+
+example:
+python benchmarks/bench_reader.py --nodes 20000 --steps 50 -t 10
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import exodus2seq as ex
+from exodus2seq_reader import Dataset
+from exodus2seq_convert import convert
+from synthetic import write_exodus
+
+from hadoop.io import SequenceFile
+from hadoop.typedbytes import *
+
+def read_generic(outdir):
+    """ Decode every record and stack the values of each variable. """
+    values = {}
+    key = TypedBytesWritable()
+    value = TypedBytesWritable()
+    for fname in sorted(os.listdir(outdir)):
+        if not fname.endswith('.seq') or fname in ('index.seq', ex.OFFSETS_FILE):
+            continue
+        reader = SequenceFile.Reader(os.path.join(outdir, fname))
+        while reader.next(key, value):
+            if not isinstance(key.get(), tuple):
+                continue
+            for name, data in value.get():
+                values.setdefault(name, []).append(ex.decode_array(data).tolist())
+        reader.close()
+    return dict([(name, np.array(rows)) for name, rows in values.items()])
+
+def read_blocks(outdir):
+    """ Read the values with iter_blocks(). """
+    values = {}
+    for block in Dataset(outdir).iter_blocks():
+        for name, data in block.values:
+            values.setdefault(name, []).append(data)
+    return dict([(name, np.concatenate(blocks)) for name, blocks in values.items()])
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--nodes', dest='nodes', type='int', default=20000,
+        help='number of nodes of the synthetic file')
+    parser.add_option('--steps', dest='steps', type='int', default=50,
+        help='number of time steps of the synthetic file')
+    parser.add_option('--variables', dest='variables', type='int', default=2,
+        help='number of node variables of the synthetic file')
+    parser.add_option('-t', '--timesteps', dest='timesteps', type='int', default=10,
+        help='number of time steps per part file')
+    options, args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_reader')
+    try:
+        exofile = os.path.join(tmpdir, 'synthetic.e')
+        names = write_exodus(exofile, options.nodes, options.steps, options.variables)
+        mbytes = options.nodes*options.steps*options.variables*8/1e6
+
+        print '%-8s %-8s %10s %10s' % ('encoding', 'reader', 'seconds', 'MB/s')
+        for encoding in ex.ENCODINGS:
+            outdir = os.path.join(tmpdir, encoding)
+            os.mkdir(outdir)
+            convert(exofile, options.timesteps, outdir, ','.join(names),
+                encoding=encoding)
+            results = []
+            for reader, read in [('generic', read_generic), ('blocks', read_blocks)]:
+                t0 = time.time()
+                results.append(read(outdir))
+                seconds = time.time() - t0
+                print '%-8s %-8s %10.3f %10.1f' % (encoding, reader, seconds,
+                    mbytes/seconds)
+            for name in names:
+                assert np.array_equal(results[0][name], results[1][name])
+            shutil.rmtree(outdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Write synthetic exodus II files for the benchmarks.
+
+The files hold what convert() reads: the time values, the x/y/z
+coordinates and smoothly varying node variables VAR0, VAR1, ...  They
+are written with exopy2.write_synthetic(), in the classic netCDF format
+and without a netCDF library.
+
+example:
+python benchmarks/synthetic.py synthetic.e --nodes 10000 --steps 100 --variables 4
+"""
+
+import os
+import sys
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import exopy2 as ep
+
+def write_exodus(filename, num_nodes, num_time_steps, num_vars, word_size=8):
+    """ Write a synthetic exodus II file, see exopy2.write_synthetic().
+
+    @return the names of the node variables
+    """
+    return ep.write_synthetic(filename, num_nodes, num_time_steps, num_vars,
+        word_size)
+
+def main():
+    parser = OptionParser(usage='%prog [options] FILE')
+    parser.add_option('--nodes', dest='nodes', type='int', default=10000,
+        help='number of nodes')
+    parser.add_option('--steps', dest='steps', type='int', default=100,
+        help='number of time steps')
+    parser.add_option('--variables', dest='variables', type='int', default=4,
+        help='number of node variables')
+    parser.add_option('--word-size', dest='word_size', type='int', default=8,
+        help='floating point word size, 4 or 8')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must specify the FILE to write')
+    write_exodus(args[0], options.nodes, options.steps, options.variables,
+        options.word_size)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
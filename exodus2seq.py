@@ -0,0 +1,643 @@
+#!/usr/bin/env python
+
+"""
+exodus2seq.py
+=============
+
+Record encodings shared by the exodus to sequence file converters.
+
+Every time step is written as a list of ``(name, data)`` tuples.  With the
+``plain`` encoding ``data`` is a list of python floats, one typedbytes
+item per value.  With the ``packed`` encoding ``data`` is the tuple
+``(dtype, shape, bytes)``: the numpy dtype string, the array shape and the
+raw array buffer in one typedbytes item.
+
+Part files normally start with the x, y and z coordinates under the keys
+-1, -2 and -3.  With shared coordinates these records are written once to
+``coords.seq`` and every part file starts with the record
+``('coords', 'coords.seq')`` instead.
+
+With a node block the time steps of a part are split into tiles of
+``<basename>_part<i>_block<k>.seq`` and the index.seq value of a tile is
+``(steps, (first step, last step), (first node, last node))``.
+
+The node-major layout writes one part file per node block.  After the
+coordinates it holds a ``'time'`` record with the time values and one
+record keyed by ``(first node, last node)`` whose value is a list of
+``(name, data)`` tuples, ``data`` holding every node's values over all
+time steps.
+
+The element, global and node set variables are written into the same
+records as the node variables, under the names ``'elem:NAME:BLOCK'``,
+``'glo:NAME'`` and ``'nset:NAME:SET'``.  With a node block they are only
+in the tiles and the node-major record of the first node.  The node-major
+layout takes only the global variables, an element or node set variable
+over all time steps would not fit the memory of a node block.
+
+Next to index.seq every dataset has ``_offsets.seq``, with the record
+``(name, ((first step, last step), (first time, last time), offsets))``
+for every part file, offsets being the
+byte offsets of the time step records, or of the node-major record, that
+a reader can seek to.  With block compression the records are not
+addressable and offsets is empty.
+
+With a time range or a stride only the selected time steps are read and
+written.  The keys keep the step numbers of the exodus file, 'total' in
+index.seq counts the selected time steps and the record ``'time_range'``
+holds the selection as the ``(start, stop, stride)`` of a slice.
+
+With delta encoding, an option of the packed encoding for time-major
+parts, the first time step of every part file is packed in full and every
+later one as the difference to the time step before it, of the integer
+bit patterns of the values, so decoding is exact.  The packed tuple then
+has a fourth item, ``{'delta': True}``, and index.seq the record
+``('delta', {'shuffle': shuffle})``.  Shuffled bytes, with or without
+delta, are grouped by their position in a value and flagged with
+``'shuffle'``.  A time step of a delta part file is decoded from the
+first time step of the part on.
+
+The node values can be written with less precision, as float32 or
+quantized to a tolerance.  A quantized array is packed as the integer
+codes of the multiples of twice the tolerance, with the flags ``{'scale':
+2*tolerance}``, and unpacks to the float64 codes*scale.  index.seq then
+has the record ``('precision', {'dtype': 'float32'})`` or ``('precision',
+{'quantize': tolerance, 'scale': 2*tolerance})``.
+
+Next to index.seq every dataset has a ``_manifest.json`` with the settings
+of the conversion, the size and modification time of the exodus file and
+the size, md5 checksum and ranges of every part file, of coords.seq and
+of the indexes.
+A rerun of the same exodus file with the same settings keeps the files
+whose size still matches the manifest, and locally their md5 checksum
+too, and converts only the others.
+
+The names of the manifest and of the offsets index start with an
+underscore, so Hadoop's FileInputFormat skips them as hidden files when a
+job reads a dataset directory as its SequenceFile input.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from hadoop.io import SequenceFile
+from hadoop.io.SequenceFile import CompressionType
+from hadoop.typedbytes import TypedBytesWritable
+
+try:
+    from hadoop.typedbytes import Bytes
+except ImportError:
+    Bytes = str
+
+ENCODINGS = ('plain', 'packed')
+COORDS = ('inline', 'shared')
+COORDS_FILE = 'coords.seq'
+LAYOUTS = ('time-major', 'node-major')
+DTYPES = ('float32', 'float64')
+MANIFEST_FILE = '_manifest.json'
+OFFSETS_FILE = '_offsets.seq'
+
+COMPRESSION_TYPES = {
+    'none': CompressionType.NONE,
+    'record': CompressionType.RECORD,
+    'block': CompressionType.BLOCK,
+}
+
+def create_writer(path, compression='record'):
+    """ Create a TypedBytesWritable SequenceFile writer.
+
+    python-hadoop compresses with the DefaultCodec (zlib) only.
+
+    @param path the name of the new sequence file
+    @param compression one of the COMPRESSION_TYPES
+    """
+    return SequenceFile.createWriter(path, TypedBytesWritable, TypedBytesWritable,
+        compression_type=COMPRESSION_TYPES[compression])
+
+def shuffle_bytes(buf, itemsize):
+    """ Group the bytes of the values by their position in a value.
+
+    The first bytes of all values come first, then all second bytes and
+    so on, so the bytes that vary little between values are next to
+    each other for the compression.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8).reshape(-1, itemsize)
+    return data.T.tostring()
+
+def unshuffle_bytes(buf, itemsize):
+    """ Undo shuffle_bytes. """
+    data = np.frombuffer(buf, dtype=np.uint8).reshape(itemsize, -1)
+    return data.T.tostring()
+
+def _int_dtype(dtype):
+    """ The integer dtype of the size and byte order of dtype. """
+    return np.dtype('i%i'%(dtype.itemsize)).newbyteorder(dtype.byteorder)
+
+class QuantizeError(ValueError):
+    """ Values that cannot be quantized, NaN, inf or too large. """
+    pass
+
+def quantize_array(data, tolerance):
+    """ Quantize values to integer multiples of twice the tolerance.
+
+    The codes times 2*tolerance differ from the values by at most the
+    tolerance.  They are computed in one pass over the array, as int32
+    when they fit and as int64 otherwise.
+
+    @return the integer codes
+    @raise QuantizeError if a value is not finite or too large to quantize
+    """
+    codes = np.rint(np.asarray(data, dtype=np.float64)/(2.0*tolerance))
+    if codes.size == 0:
+        return codes.astype(np.int32)
+    largest = np.abs(codes).max()
+    if not np.isfinite(largest) or largest >= 2.0**63:
+        raise QuantizeError('cannot quantize the values to the tolerance %g'%(tolerance))
+    if largest < 2**31:
+        return codes.astype(np.int32)
+    return codes.astype(np.int64)
+
+def reduce_precision(data, dtype=None, quantize=None):
+    """ Downcast or quantize an array of values.
+
+    @param dtype one of DTYPES to cast to, None to keep the dtype
+    @param quantize the tolerance of quantize_array, None to not quantize
+    """
+    if quantize is not None:
+        return quantize_array(data, quantize)
+    if dtype is not None:
+        return np.asarray(data).astype(dtype)
+    return data
+
+def pack_array(data, previous=None, shuffle=False, scale=None):
+    """ Pack a numpy array into a (dtype, shape, bytes) tuple.
+
+    The bytes are taken straight from the contiguous array memory,
+    the values are not touched one by one.
+
+    With previous, the bytes hold the difference to previous instead.
+    It is taken on the bit patterns of the values viewed as integers,
+    so adding it back gives exactly the same values, and the tuple gets
+    a fourth item, the flags {'delta': True}.  With shuffle the bytes
+    are grouped by shuffle_bytes and the flags hold 'shuffle'.
+
+    With scale the data are the codes of quantize_array, to be
+    multiplied by scale, and the flags hold 'scale'.
+
+    @param previous the array of the previous time step, of the same
+        dtype and shape
+    @param scale the step of the quantized codes
+    """
+    # not ascontiguousarray, that turns a scalar into a 1-d array
+    data = np.array(data, copy=False, order='C')
+    flags = {}
+    if previous is not None:
+        ints = _int_dtype(data.dtype)
+        # the integers wrap around, which is undone by the addition
+        with np.errstate(over='ignore'):
+            delta = data.view(ints) - np.asarray(previous, dtype=data.dtype).view(ints)
+        buf = delta.astype(ints).tostring()
+        flags['delta'] = True
+    else:
+        buf = data.tostring()
+    if shuffle and data.dtype.itemsize > 1:
+        buf = shuffle_bytes(buf, data.dtype.itemsize)
+        flags['shuffle'] = True
+    if scale is not None:
+        flags['scale'] = float(scale)
+    packed = (data.dtype.str, tuple(int(n) for n in data.shape), Bytes(buf))
+    if flags:
+        packed += (flags,)
+    return packed
+
+def unpack_array(packed, previous=None):
+    """ Return the numpy array of a (dtype, shape, bytes) tuple.
+
+    The array is a read only np.frombuffer view on the bytes, unless the
+    bytes are shuffled or a difference, or the array is quantized.
+
+    @param previous the array of the previous time step, for a packed
+        difference
+    @raise ValueError if the array is a difference and previous is None
+    """
+    dtype, shape, buf = np.dtype(packed[0]), packed[1], packed[2]
+    flags = {}
+    if len(packed) > 3:
+        flags = packed[3]
+    if flags.get('shuffle'):
+        buf = unshuffle_bytes(buf, dtype.itemsize)
+    if flags.get('delta'):
+        if previous is None:
+            raise ValueError('a difference needs the previous time step')
+        if 'scale' in flags:
+            # back to the codes of the previous time step
+            previous = np.rint(np.asarray(previous, dtype=np.float64)/flags['scale'])
+        ints = _int_dtype(dtype)
+        with np.errstate(over='ignore'):
+            data = np.frombuffer(buf, dtype=ints) + np.asarray(previous, dtype=dtype).reshape(-1).view(ints)
+        data = data.astype(ints).view(dtype).reshape(shape)
+    else:
+        data = np.frombuffer(buf, dtype=dtype).reshape(shape)
+    if 'scale' in flags:
+        return data*flags['scale']
+    return data
+
+def packed_dtype(packed):
+    """ The dtype of the array that unpack_array returns. """
+    if len(packed) > 3 and 'scale' in packed[3]:
+        return np.dtype(np.float64)
+    return np.dtype(packed[0])
+
+def encode_array(data, encoding, previous=None, shuffle=False, scale=None):
+    """ Encode a numpy array as a typedbytes friendly value.
+
+    @param data the numpy array
+    @param encoding one of ENCODINGS
+    @param previous the array of the previous time step to take the
+        difference to, packed only
+    @param shuffle shuffle the packed bytes
+    @param scale the step of quantized codes, packed only
+    """
+    if encoding == 'plain':
+        # python floats, to avoid the PICKLE type code
+        return data.tolist()
+    elif encoding == 'packed':
+        return pack_array(data, previous, shuffle, scale)
+    raise ValueError('unknown encoding %s'%(encoding))
+
+def decode_array(data, previous=None):
+    """ Turn a plain or packed value back into a numpy array.
+
+    @param previous the decoded array of the previous time step, for a
+        packed difference
+    """
+    if isinstance(data, tuple):
+        return unpack_array(data, previous)
+    return np.asarray(data)
+
+def decode_values(value, previous=None):
+    """ Decode the value of a time step record into (name, array) tuples.
+
+    @param previous the decoded (name, array) tuples of the previous time
+        step in the part file, for delta encoded values
+    """
+    previous = dict(previous or [])
+    return [(name, decode_array(data, previous.get(name))) for name, data in value]
+
+def parse_size(size):
+    """ Parse a byte count such as 1048576, 512K, 128M or 1G. """
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    size = str(size).strip().upper()
+    if size.endswith('B'):
+        size = size[:-1]
+    if size and size[-1] in units:
+        return int(float(size[:-1])*units[size[-1]])
+    return int(size)
+
+def parse_time_range(text):
+    """ Parse START:END into a (start, end) tuple of a python slice.
+
+    Either end may be left out and is None then, e.g. '10:' or ':-5'.
+    """
+    fields = text.split(':')
+    if len(fields) != 2:
+        raise ValueError('invalid time range %s'%(text))
+    return tuple([int(field) if field.strip() else None for field in fields])
+
+def select_time_steps(num_time_steps, time_range=None, stride=1):
+    """ The selected time steps as (start, stop, stride) of xrange.
+
+    @param num_time_steps the number of time steps of the exodus file
+    @param time_range the (start, end) of a python slice, None for all
+    @param stride take every stride-th time step
+    """
+    if time_range is None:
+        time_range = (None, None)
+    return slice(time_range[0], time_range[1], stride).indices(num_time_steps)
+
+def parse_ids(text):
+    """ Parse a comma delimited list of block or set ids. """
+    return [int(field) for field in text.split(',')]
+
+def extra_variables(f, elem_variables=None, elem_blocks=None,
+        global_variables=None, nodeset_variables=None):
+    """ The element, global and node set variables to write with the
+    node variables.
+
+    The values are named 'elem:NAME:BLOCK', 'glo:NAME' and 'nset:NAME:SET'
+    by the variable name and the block or set id.  An element or node set
+    variable is taken from the blocks or sets the truth table has it in.
+
+    @param f the open ExoFile
+    @param elem_variables a comma delimited list of element variables
+    @param elem_blocks a comma delimited list of element block ids, None
+        for all blocks
+    @param global_variables a comma delimited list of global variables
+    @param nodeset_variables a comma delimited list of node set variables
+    @return a list of (name, values) tuples, the values are indexed by
+        time step first and read only when they are sliced
+    @raise KeyError if a variable or a block does not exist
+    """
+    extra = []
+    if elem_variables:
+        blocks = f.element_block_ids()
+        if elem_blocks:
+            for block in parse_ids(elem_blocks):
+                if block not in blocks:
+                    raise KeyError('element block %i'%(block))
+            blocks = parse_ids(elem_blocks)
+        for name in [name.strip() for name in elem_variables.split(',')]:
+            if f.element_variable_index(name) is None:
+                raise KeyError('element variable %s'%(name))
+            for block in blocks:
+                try:
+                    extra.append(('elem:%s:%i'%(name, block),
+                        f.element_variable(name, block)))
+                except KeyError:
+                    # not in this block
+                    pass
+    if global_variables:
+        for name in [name.strip() for name in global_variables.split(',')]:
+            if f.global_variable_index(name) is None:
+                raise KeyError('global variable %s'%(name))
+            extra.append(('glo:%s'%(name), f.global_variable(name)))
+    if nodeset_variables:
+        for name in [name.strip() for name in nodeset_variables.split(',')]:
+            if f.node_set_variable_index(name) is None:
+                raise KeyError('node set variable %s'%(name))
+            for nodeset in f.node_set_ids():
+                try:
+                    extra.append(('nset:%s:%i'%(name, nodeset),
+                        f.node_set_variable(name, nodeset)))
+                except KeyError:
+                    # not in this set
+                    pass
+    return extra
+
+def precision_word_size(word_size, dtype=None, quantize=None, largest=None):
+    """ The bytes per node value written, for the word size of the
+    exodus file and the precision options.
+
+    @param largest the largest absolute node value, the quantized codes
+        are int32 when it fits them, see quantize_array, and int64 when
+        it does not or is None
+    """
+    if quantize is not None:
+        if largest is not None and np.rint(largest/(2.0*quantize)) < 2**31:
+            return 4
+        return 8
+    if dtype is not None:
+        return np.dtype(dtype).itemsize
+    return word_size
+
+def largest_node_value(f, names, steps):
+    """ The largest absolute value of node variables at some time steps.
+
+    @param f the ExoFile
+    @param names the names of the node variables, the ones that do not
+        exist are left out
+    @param steps the time steps to read
+    @return the value, NaN or inf with a value that is not finite, None
+        without any value
+    """
+    largest = None
+    for name in names:
+        if f.node_variable_index(name) is None:
+            continue
+        var = f.node_variable(name)
+        for step in steps:
+            values = np.asarray(var[step], dtype=np.float64)
+            if values.size > 0:
+                value = np.abs(values).max()
+                if largest is None or not value <= largest:
+                    largest = value
+    return largest
+
+def steps_for_part_bytes(part_bytes, num_nodes, num_vars, word_size):
+    """ The number of time steps whose node values fill part_bytes.
+
+    @param part_bytes the target size of a part file
+    @param num_nodes the number of nodes of the mesh
+    @param num_vars the number of node variables written
+    @param word_size the floating point word size of the exodus file
+    @return the number of time steps, at least 1
+    """
+    step_bytes = num_nodes*max(num_vars, 1)*word_size
+    return max(1, part_bytes//step_bytes)
+
+def transpose_node_blocks(vardata, num_time_steps, steps, nodeblocks, tmpdir=None,
+        start=0, stride=1):
+    """ A blocked out-of-core transpose of node variables.
+
+    The time-major values are read in slabs of steps time steps.  Every
+    slab is scattered into a temporary memory mapped file per variable
+    that stores each node block as one contiguous (time steps x nodes)
+    array, so the memory use is bounded by a slab and by one node block
+    and not by the size of the variables.
+
+    @param vardata a list of (name, variable) tuples of the node variables
+    @param num_time_steps the number of time steps
+    @param steps the number of time steps read at once
+    @param nodeblocks a list of the (first, last) nodes of every block
+    @param tmpdir where to put the temporary files, see tempfile
+    @param start the first time step
+    @param stride the time steps are start, start+stride, ...
+    @return a generator of ((first, last), [(name, array)]) tuples, one
+        per node block, each array is (nodes x time steps)
+    """
+    width = max([last - first + 1 for first, last in nodeblocks])
+    tmpdir = tempfile.mkdtemp(prefix='exodus2seq', dir=tmpdir)
+    try:
+        blocks = []
+        for m, (name, var) in enumerate(vardata):
+            mm = None
+            for begin in xrange(0, num_time_steps, steps):
+                end = min(begin + steps, num_time_steps)
+                slab = var[start+begin*stride:start+(end-1)*stride+1:stride]
+                if mm is None:
+                    mm = np.memmap(os.path.join(tmpdir, 'var%i'%(m)),
+                        dtype=slab.dtype, mode='w+',
+                        shape=(len(nodeblocks), num_time_steps, width))
+                for k, (first, last) in enumerate(nodeblocks):
+                    mm[k,begin:end,:last-first+1] = slab[:,first:last+1]
+            if mm is not None:
+                mm.flush()
+            blocks.append((name, mm))
+
+        for k, (first, last) in enumerate(nodeblocks):
+            blockdata = []
+            for name, mm in blocks:
+                if mm is None:
+                    data = np.zeros((last-first+1, 0))
+                else:
+                    data = np.array(mm[k,:,:last-first+1].T)
+                blockdata.append((name, data))
+            yield (first, last), blockdata
+    finally:
+        blocks = None
+        mm = None
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def manifest_config(steps, variables, encoding='plain', coords='inline',
+        part_bytes=None, node_block=None, layout='time-major',
+        compression='record', time_range=None, stride=1,
+        elem_variables=None, elem_blocks=None, global_variables=None,
+        nodeset_variables=None, delta=False, shuffle=False, dtype=None,
+        quantize=None, source=None, **kwargs):
+    """ The settings of a conversion that a manifest is valid for.
+
+    The arguments are those of convert(), any argument that does not
+    change the output files, such as workers, is ignored.
+
+    @param source the source_info of the exodus file, so a changed
+        exodus file is converted again
+    """
+    config = dict(steps=steps, encoding=encoding, coords=coords,
+        part_bytes=part_bytes, node_block=node_block, layout=layout,
+        compression=compression,
+        variables=[var.strip() for var in variables.split(',')])
+    if time_range is not None:
+        config['time_range'] = list(time_range)
+    if stride != 1:
+        config['stride'] = stride
+    if delta:
+        config['delta'] = True
+    if shuffle:
+        config['shuffle'] = True
+    if dtype is not None:
+        config['dtype'] = dtype
+    if quantize is not None:
+        config['quantize'] = quantize
+    if source is not None:
+        config['source'] = source
+    for key, names in [('elem_variables', elem_variables),
+            ('elem_blocks', elem_blocks), ('global_variables', global_variables),
+            ('nodeset_variables', nodeset_variables)]:
+        if names is not None:
+            config[key] = [name.strip() for name in names.split(',')]
+    # the form it has after a round trip through json
+    return json.loads(json.dumps(config))
+
+def source_info(path):
+    """ The size and the modification time in milliseconds of a local
+    exodus file, as storage.status() gives them for a remote one. """
+    st = os.stat(path)
+    return {'bytes': st.st_size, 'mtime': int(st.st_mtime*1000)}
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    f = open(path, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(1<<20), ''):
+            md5.update(chunk)
+    finally:
+        f.close()
+    return md5.hexdigest()
+
+def manifest_entry(path, steps=None, nodes=None, offsets=None):
+    """ The manifest entry of a file that was just written.
+
+    @param path the local file
+    @param steps the (first, last) time steps in the file
+    @param nodes the (first, last) nodes in the file
+    @param offsets the byte offsets of the records of the time steps
+    """
+    entry = {'bytes': os.path.getsize(path), 'md5': file_md5(path)}
+    if steps is not None:
+        entry['steps'] = list(steps)
+    if nodes is not None:
+        entry['nodes'] = list(nodes)
+    if offsets is not None:
+        entry['offsets'] = list(offsets)
+    return entry
+
+def write_offsets(outdir, entries, times, compression='record'):
+    """ Write _offsets.seq, the random access index of the part files.
+
+    @param entries a list of (file name, manifest entry) tuples of the
+        part files, in order
+    @param times the time values of all time steps of the exodus file
+    """
+    writer = create_writer(os.path.join(outdir,OFFSETS_FILE), compression)
+    key = TypedBytesWritable()
+    value = TypedBytesWritable()
+    for name, entry in entries:
+        first, last = entry['steps']
+        key.set(name)
+        value.set(((first, last), (float(times[first]), float(times[last])),
+            [int(offset) for offset in entry.get('offsets', [])]))
+        writer.append(key,value)
+    writer.close()
+
+def write_manifest(outdir, config, files):
+    """ Write the manifest of a dataset.
+
+    @param config the manifest_config of the conversion
+    @param files a dictionary of the manifest entries by file name
+    """
+    f = open(os.path.join(outdir, MANIFEST_FILE), 'w')
+    try:
+        json.dump({'config': config, 'files': files}, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+def parse_manifest(text):
+    """ The manifest in text, or None if it is not a manifest. """
+    try:
+        manifest = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(manifest, dict) or 'files' not in manifest:
+        return None
+    return manifest
+
+def read_manifest(outdir):
+    """ The manifest of a local dataset, or None. """
+    path = os.path.join(outdir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    f = open(path)
+    try:
+        return parse_manifest(f.read())
+    finally:
+        f.close()
+
+def valid_files(manifest, config, sizes):
+    """ The manifest entries of the files that need not be written again.
+
+    @param manifest the manifest of an earlier conversion, or None
+    @param config the manifest_config of this conversion
+    @param sizes a dictionary of the sizes of the files that exist
+    @return a dictionary of the manifest entries by file name
+    """
+    if manifest is None or manifest.get('config') != config:
+        return {}
+    keep = {}
+    for name, entry in manifest['files'].items():
+        if sizes.get(name) == entry.get('bytes'):
+            keep[str(name)] = entry
+    return keep
+
+def valid_local_files(outdir, config):
+    """ The manifest entries of the files of a local dataset that need
+    not be written again, their md5 checksums are checked too.
+
+    @param config the manifest_config of this conversion
+    """
+    keep = valid_files(read_manifest(outdir), config, local_sizes(outdir))
+    for name, entry in keep.items():
+        if entry.get('md5') != file_md5(os.path.join(outdir, name)):
+            del keep[name]
+    return keep
+
+def local_sizes(dirname):
+    """ The sizes of the files in a local directory. """
+    sizes = {}
+    for fname in os.listdir(dirname):
+        if os.path.isfile(os.path.join(dirname, fname)):
+            sizes[fname] = os.path.getsize(os.path.join(dirname, fname))
+    return sizes
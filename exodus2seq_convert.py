@@ -0,0 +1,935 @@
+#!/usr/bin/env python
+
+"""
+exodus2seq_convert.py
+=====================
+
+The conversion engine of the exodus to sequence file converters.
+
+convert() turns one exodus file into a dataset of part files, index.seq,
+_offsets.seq and _manifest.json, see exodus2seq for the formats.  Both
+MapReduce jobs, mr_exodus2seq_hadoop.py and mr_exodus2seq_local.py, call
+it and take their conversion options from add_options() and
+load_options().
+
+Run as a script, it converts the exodus files listed in an input file on
+the local machine with a pool of processes, one file per process at a
+time, and prints every file with 0 if it was converted and 1 if not, as
+the reducer of the jobs does:
+
+python exodus2seq_convert.py input.txt -t 10 -d /scratch/data --variables TEMP --processes 8
+
+A Stats object collects the time of every stage of a conversion and the
+bytes, time steps and part files it read and wrote.  The jobs report them
+as counters of the group exodus2seq, local runs also write them to
+<name>.stats.json next to the dataset of every input file.
+"""
+
+import sys
+import os
+import json
+import time
+import shutil
+import traceback
+import contextlib
+import multiprocessing
+from optparse import OptionParser
+
+import numpy as np
+
+import exopy2 as ep
+import exodus2seq as ex
+
+from hadoop.typedbytes import *
+
+COUNTER_GROUP = 'exodus2seq'
+REPORT_SUFFIX = '.stats.json'
+
+class Stats(object):
+    """ The seconds of the stages of a conversion and the counts of what
+    it read and wrote.
+    
+    The stages are fetch and upload, timed by the jobs, and open, read,
+    encode, write and index, timed by convert().  encode is the float
+    conversion or the packing of the values, write the typedbytes
+    serialization, the compression and the local disk writes of the
+    records, index writing index.seq, _offsets.seq and the manifest.
+    convert is the wall time of convert() as a whole, the other stages
+    are summed over the processes of a --workers pool.  The counts are
+    bytes_read, the node and extra values read from the exodus file,
+    bytes_written, steps, parts and parts_kept.
+    """
+    def __init__(self, seconds=None, counts=None):
+        self.seconds = dict(seconds or {})
+        self.counts = dict(counts or {})
+        
+    def add_time(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+        
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """ Time a with block as a stage. """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.time() - t0)
+            
+    def timed(self, stage, iterable):
+        """ Iterate over iterable, timing the steps of the iteration as a
+        stage. """
+        iterator = iter(iterable)
+        while True:
+            t0 = time.time()
+            try:
+                item = iterator.next()
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stage, time.time() - t0)
+            yield item
+            
+    def update(self, other):
+        """ Add the seconds and counts of another Stats. """
+        for stage, seconds in other.seconds.items():
+            self.add_time(stage, seconds)
+        for name, n in other.counts.items():
+            self.count(name, n)
+            
+    def to_dict(self):
+        return {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+        
+    def counters(self):
+        """ The (name, amount) integer counters, the seconds of a stage
+        as 'STAGE ms'. """
+        counters = [('%s ms'%(stage), int(round(1000*seconds)))
+            for stage, seconds in sorted(self.seconds.items())]
+        counters.extend(sorted(self.counts.items()))
+        return counters
+        
+def write_report(outdir, inputfile, result, stats):
+    """ Write the JSON summary of the conversion of an exodus file,
+    <name>.stats.json in outdir.
+    
+    @param result 0 if the file was converted, 1 if not
+    @param stats the Stats of the conversion
+    """
+    report = stats.to_dict()
+    report['input'] = inputfile
+    report['result'] = result
+    f = open(os.path.join(outdir, dataset_name(inputfile) + REPORT_SUFFIX), 'w')
+    try:
+        json.dump(report, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+        
+def dataset_name(inputfile):
+    """ The name of the dataset of an exodus file, its base name up to
+    the extension. """
+    basename = os.path.basename(inputfile)
+    ind = basename.rfind('.')
+    return basename[0:ind]
+    
+class PartWriter(object):
+    """ Writes the part files of one exodus file.
+    
+    The time and coordinate data are read once, the node variables are
+    read one partition at a time.  Every process of a --workers pool
+    has a PartWriter of its own.
+    """
+    def __init__(self, f, varindex, encoding='plain', coords='inline',
+            compression='record', stride=1, extravars=None,
+            delta=False, shuffle=False, dtype=None, quantize=None):
+        """
+        @param f the open ExoFile
+        @param varindex a list of (name, index) tuples of the node variables
+        @param encoding the encoding of the node values, see exodus2seq
+        @param coords 'inline' or 'shared' coordinates
+        @param compression the SequenceFile compression type, see exodus2seq
+        @param stride write only every stride-th time step
+        @param extravars a dictionary of the keyword arguments of
+            exodus2seq.extra_variables, for the element, global and node
+            set variables
+        @param delta pack the time steps after the first of a part file
+            as differences to the time step before
+        @param shuffle shuffle the bytes of the packed values
+        @param dtype write the node values as float32 or float64, None
+            for the word size of the exodus file
+        @param quantize write the node values quantized to this absolute
+            tolerance, see exodus2seq.quantize_array
+        """
+        self.f = f
+        self.encoding = encoding
+        self.coords = coords
+        self.compression = compression
+        self.stride = stride
+        self.delta = delta
+        self.shuffle = shuffle
+        self.dtype = dtype
+        self.quantize = quantize
+        self.scale = None
+        if quantize is not None:
+            self.scale = 2.0*quantize
+        self.stats = Stats()
+        
+        # Get time data and coordinate (x,y,z) data
+        time = f.cdf.variables["time_whole"]
+        timedata = time.getValue()
+        coordz = f.cdf.variables["coordz"]
+        zdata = coordz.getValue()
+        coordy = f.cdf.variables["coordy"]
+        ydata = coordy.getValue()
+        coordx = f.cdf.variables["coordx"]
+        xdata = coordx.getValue()
+        
+        # To avoid PICKLE type in typedbytes files, tolist() converts the
+        # whole array to python floats in one pass
+        self.timearray = timedata
+        self.timedata = timedata.tolist()
+        self.coordarrays = [(-1, xdata), (-2, ydata), (-3, zdata)]
+        self.coorddata = [(ckey, self.encode(cdata))
+            for ckey, cdata in self.coordarrays]
+        
+        # keep only the variable handles, the values are read one
+        # partition at a time
+        self.vardata = []
+        for name, vindex in varindex:
+            tmp = f.node_variable(name)
+            self.vardata.append((name, tmp))
+        self.extradata = ex.extra_variables(f, **(extravars or {}))
+            
+    def encode(self, data, previous=None, scale=None):
+        """ Encode the node values of a numpy array.
+        
+        @param previous the values of the previous time step, to pack
+            the difference to
+        @param scale the step of quantized values
+        """
+        return ex.encode_array(data, self.encoding, previous, self.shuffle, scale)
+        
+    def reduce(self, data):
+        """ Downcast or quantize node values, in one pass over the array. """
+        return ex.reduce_precision(data, self.dtype, self.quantize)
+        
+    def write_coords(self, outdir):
+        """ Write the coordinates once for the whole dataset. """
+        writer = ex.create_writer(os.path.join(outdir,ex.COORDS_FILE),
+            self.compression)
+        key = TypedBytesWritable()
+        value = TypedBytesWritable()
+        for ckey, cdata in self.coorddata:
+            key.set(ckey)
+            value.set(cdata)
+            writer.append(key,value)
+        writer.close()
+        
+    def _append_coords(self, writer, key, value, nodes):
+        """ Start a part file with the coordinates of its nodes. """
+        if self.coords == 'shared':
+            # refer to the coordinates in coords.seq
+            key.set('coords')
+            value.set(ex.COORDS_FILE)
+            writer.append(key,value)
+        else:
+            coorddata = self.coorddata
+            if nodes is not None:
+                coorddata = [(ckey, self.encode(cdata[nodes[0]:nodes[1]+1]))
+                    for ckey, cdata in self.coordarrays]
+            for ckey, cdata in coorddata:
+                key.set(ckey)
+                value.set(cdata)
+                writer.append(key,value)
+                
+    def _offset(self, writer):
+        """ The byte offset of the next record, None when the records
+        are buffered by block compression. """
+        if self.compression == 'block':
+            return None
+        return writer.getLength()
+        
+    def write(self, outdir, outputfilename, begin, end, nodes=None):
+        """ Write every stride-th time step of [begin, end] to one part file.
+        
+        @param nodes None to write all nodes or the (first, last) nodes
+            of a tile, only the tiles of the first node get the element,
+            global and node set variables
+        @return the byte offsets of the time step records, an empty
+            list with block compression
+        """
+        writer = ex.create_writer(os.path.join(outdir,outputfilename),
+            self.compression)
+        key = TypedBytesWritable()
+        value = TypedBytesWritable()
+        self._append_coords(writer, key, value, nodes)
+        
+        # read only the selected time steps of each variable, copied
+        # here so that reading a memory mapped file is timed as read
+        partdata = []
+        with self.stats.stage('read'):
+            for name, tmp in self.vardata:
+                if nodes is None:
+                    partdata.append((name, np.array(tmp[begin:end+1:self.stride])))
+                else:
+                    # and only the nodes of the tile
+                    partdata.append((name, np.array(tmp[begin:end+1:self.stride,nodes[0]:nodes[1]+1])))
+            if nodes is None or nodes[0] == 0:
+                for name, tmp in self.extradata:
+                    partdata.append((name, np.array(tmp[begin:end+1:self.stride])))
+        self.stats.count('bytes_read', sum([data.nbytes for name, data in partdata]))
+        with self.stats.stage('encode'):
+            partdata = [(name, self.reduce(data)) for name, data in partdata[:len(self.vardata)]] + \
+                partdata[len(self.vardata):]
+        
+        offsets = []
+        # the values of the previous time step, with --delta
+        previous = {}
+        for j in xrange(begin, end+1, self.stride):
+            offsets.append(self._offset(writer))
+            key.set((j,self.timedata[j]))
+            valuedata = []
+            with self.stats.stage('encode'):
+                for m, var in enumerate(partdata):
+                    name = var[0]
+                    tmp = var[1][(j-begin)//self.stride]
+                    scale = None
+                    if m < len(self.vardata):
+                        # a node variable
+                        scale = self.scale
+                    data = self.encode(tmp, previous.get(name), scale)
+                    if self.delta:
+                        previous[name] = tmp
+                    valuedata.append((name,data))
+                value.set(valuedata)
+            with self.stats.stage('write'):
+                writer.append(key,value)
+        with self.stats.stage('write'):
+            writer.close()
+        self.stats.count('parts')
+        if None in offsets:
+            return []
+        return offsets
+        
+    def write_nodes(self, outdir, outputfilename, begin, end, nodes, blockdata):
+        """ Write one node block of the node-major layout to a part file.
+        
+        @param begin the first time step
+        @param end the last time step, the time record holds every
+            stride-th time step of [begin, end]
+        @param nodes the (first, last) nodes of the block
+        @param blockdata a list of (name, array) tuples, each array holds
+            the values of the block's nodes over all time steps.  The
+            block of the first node also gets the global variables,
+            convert() allows no other extra variables with this layout
+        @return the byte offset of the node block record in a list, an
+            empty list with block compression
+        """
+        writer = ex.create_writer(os.path.join(outdir,outputfilename),
+            self.compression)
+        key = TypedBytesWritable()
+        value = TypedBytesWritable()
+        self._append_coords(writer, key, value, nodes)
+        key.set('time')
+        value.set(self.encode(self.timearray[begin:end+1:self.stride]))
+        writer.append(key,value)
+        
+        offset = self._offset(writer)
+        key.set(tuple(nodes))
+        valuedata = []
+        with self.stats.stage('encode'):
+            for name, data in blockdata:
+                valuedata.append((name,self.encode(self.reduce(data), scale=self.scale)))
+        if nodes[0] == 0:
+            for name, tmp in self.extradata:
+                with self.stats.stage('read'):
+                    data = np.array(tmp[begin:end+1:self.stride].T)
+                self.stats.count('bytes_read', data.nbytes)
+                with self.stats.stage('encode'):
+                    valuedata.append((name,self.encode(data)))
+        with self.stats.stage('encode'):
+            value.set(valuedata)
+        with self.stats.stage('write'):
+            writer.append(key,value)
+            writer.close()
+        self.stats.count('parts')
+        if offset is None:
+            return []
+        return [offset]
+        
+# the PartWriter of a --workers pool process
+_partwriter = None
+
+def _init_worker(inputfile, varindex, writeropts):
+    global _partwriter
+    _partwriter = PartWriter(ep.ExoFile(inputfile,'r'), varindex, **writeropts)
+    
+def _write_part(part):
+    """ Write a part in a pool process, return its offsets and the
+    dictionary of its Stats. """
+    _partwriter.stats = Stats()
+    offsets = _partwriter.write(*part)
+    return offsets, _partwriter.stats.to_dict()
+
+def convert(inputfile, steps, outdir, variables, encoding='plain', coords='inline',
+        workers=1, part_bytes=None, node_block=None, layout='time-major',
+        compression='record', time_range=None, stride=1,
+        elem_variables=None, elem_blocks=None, global_variables=None,
+        nodeset_variables=None, delta=False, shuffle=False, dtype=None,
+        quantize=None, subdir=False, keep=None, stats=None, source=None):
+    """ Convert an exodus file into a dataset of sequence files.
+    
+    @param time_range the (start, stop) time steps to convert, with the
+        semantics of a python slice, None for all time steps
+    @param stride convert only every stride-th time step of time_range
+    @param elem_variables a comma delimited list of element variables
+    @param elem_blocks a comma delimited list of the element block ids
+        of elem_variables, None for all blocks
+    @param global_variables a comma delimited list of global variables
+    @param nodeset_variables a comma delimited list of node set variables
+    @param delta pack every time step after the first of a part file as
+        the difference to the time step before, packed time-major only
+    @param shuffle shuffle the bytes of the packed values
+    @param dtype write the node values as one of exodus2seq.DTYPES, None
+        for the word size of the exodus file, packed only
+    @param quantize write the node values quantized to this absolute
+        tolerance, packed only
+    @param subdir write the dataset into a new directory of outdir named
+        after the exodus file, or resume the conversion in it
+    @param keep a dictionary of the manifest entries of the files that
+        are valid at the destination already, they are not written
+    @param stats a Stats to add the times and counts of the conversion to
+    @param source the source_info of the exodus file, that of inputfile
+        by default, for a local copy of a remote exodus file
+    """
+    if stats is None:
+        stats = Stats()
+    t0 = time.time()
+    config = ex.manifest_config(steps, variables, encoding=encoding,
+        coords=coords, part_bytes=part_bytes, node_block=node_block,
+        layout=layout, compression=compression,
+        time_range=time_range, stride=stride, elem_variables=elem_variables,
+        elem_blocks=elem_blocks, global_variables=global_variables,
+        nodeset_variables=nodeset_variables, delta=delta, shuffle=shuffle,
+        dtype=dtype, quantize=quantize,
+        source=source or ex.source_info(inputfile))
+    extravars = dict(elem_variables=elem_variables, elem_blocks=elem_blocks,
+        global_variables=global_variables, nodeset_variables=nodeset_variables)
+    if (delta or shuffle) and encoding != 'packed':
+        print >> sys.stderr, 'Delta encoding and shuffling need the packed encoding'
+        return False
+    if delta and layout != 'time-major':
+        print >> sys.stderr, 'Delta encoding needs the time-major layout'
+        return False
+    if (elem_variables or nodeset_variables) and layout != 'time-major':
+        # they would be read over all time steps at once
+        print >> sys.stderr, 'Element and node set variables need the time-major layout'
+        return False
+    if (dtype is not None or quantize is not None) and encoding != 'packed':
+        print >> sys.stderr, 'A dtype or quantization needs the packed encoding'
+        return False
+    
+    f = ep.ExoFile(inputfile,'r')
+    total_time_steps = f.num_time_steps
+    
+    # the selected time steps, only these are read
+    start, stop, stride = ex.select_time_steps(total_time_steps, time_range, stride)
+    selected = xrange(start, stop, stride)
+    num_time_steps = len(selected)
+    if num_time_steps == 0:
+        print >> sys.stderr, 'No time steps selected out of', total_time_steps
+        return False
+    
+    Vars = variables.split(',')
+    
+    if part_bytes is not None:
+        if layout == 'node-major':
+            # the steps are the slab of the transpose, which reads one
+            # variable of every node at a time, before any conversion
+            steps = ex.steps_for_part_bytes(part_bytes, f.num_nodes, 1,
+                f.floating_point_word_size)
+        else:
+            # size the partitions so the node values fill part_bytes
+            num_nodes = f.num_nodes
+            if node_block is not None:
+                num_nodes = min(node_block, num_nodes)
+            largest = None
+            if quantize is not None:
+                # the width of the quantized codes, from the first and the
+                # last selected time step
+                largest = ex.largest_node_value(f,
+                    [var.strip() for var in Vars], [selected[0], selected[-1]])
+            steps = ex.steps_for_part_bytes(part_bytes, num_nodes, len(Vars),
+                ex.precision_word_size(f.floating_point_word_size, dtype, quantize,
+                largest))
+        steps = min(steps, num_time_steps)
+    elif num_time_steps < steps and layout == 'time-major':
+        print >> sys.stderr, 'The total time steps is', num_time_steps
+        print >> sys.stderr, 'The patitions step is',steps,'. No need to patition the file.'
+        return False
+    
+    # Get variable data
+    varindex = []
+    for var in Vars:
+        vindex = f.node_variable_index(var.strip())
+        if vindex is None:
+            print  >> sys.stderr, 'The variable ', var.strip(), 'does not exist!'
+            return False
+        varindex.append((var.strip(), vindex))
+    try:
+        ex.extra_variables(f, **extravars)
+    except KeyError, e:
+        print >> sys.stderr, 'The', e.args[0], 'does not exist!'
+        return False
+    
+    # Begin to partition
+    basename = dataset_name(inputfile)
+    
+    if subdir:
+        outdir = os.path.join(outdir,basename)
+        if os.path.isdir(outdir):
+            # resume an earlier conversion, files that are not valid any
+            # more are written again
+            if keep is None:
+                keep = ex.valid_local_files(outdir, config)
+            # the indexes are always written again
+            keep = dict([(fname, entry) for fname, entry in keep.items()
+                if fname not in ('index.seq', ex.OFFSETS_FILE)])
+            for fname in os.listdir(outdir):
+                if os.path.isdir(os.path.join(outdir,fname)):
+                    # the temporary files of an interrupted transpose
+                    shutil.rmtree(os.path.join(outdir,fname))
+                elif fname not in keep:
+                    os.remove(os.path.join(outdir,fname))
+        else:
+            os.mkdir(outdir)
+    
+    if keep is None:
+        keep = {}
+    
+    indexkey = TypedBytesWritable()
+    indexvalue = TypedBytesWritable()
+    indexwriter = ex.create_writer(os.path.join(outdir,'index.seq'),
+        compression)
+    
+    writeropts = dict(encoding=encoding, coords=coords,
+        compression=compression, stride=stride,
+        extravars=extravars, delta=delta, shuffle=shuffle, dtype=dtype,
+        quantize=quantize)
+    partwriter = PartWriter(f, varindex, **writeropts)
+    partwriter.stats = stats
+    stats.add_time('open', time.time() - t0)
+    if coords == 'shared' and ex.COORDS_FILE not in keep:
+        with stats.stage('write'):
+            partwriter.write_coords(outdir)
+    
+    # with --node-block every time partition is split into node tiles
+    nodeblocks = []
+    if node_block is not None:
+        num_nodes = f.num_nodes
+        for nbegin in xrange(0, num_nodes, node_block):
+            nodeblocks.append((nbegin, min(nbegin + node_block, num_nodes) - 1))
+    
+    parts = []
+    counts = []
+    # the record offsets of the part files that are written
+    offsets = {}
+    
+    try:
+        if layout == 'node-major':
+            # one part file per node block, the values are transposed out of
+            # core in slabs of steps time steps, next to the output
+            blocks = ex.transpose_node_blocks(partwriter.vardata, num_time_steps,
+                steps, nodeblocks, tmpdir=outdir, start=start, stride=stride)
+            for k, (nodes, blockdata) in enumerate(stats.timed('read', blocks)):
+                stats.count('bytes_read', sum([data.nbytes for name, data in blockdata]))
+                outputfilename = basename + '_part'+ str(k) + '.seq'
+                parts.append((outdir, outputfilename, selected[0], selected[-1], nodes))
+                if outputfilename not in keep:
+                    offsets[outputfilename] = partwriter.write_nodes(outdir,
+                        outputfilename, selected[0], selected[-1], nodes, blockdata)
+                counts.append(num_time_steps)
+        else:
+            begin = 0
+            i = 0
+        
+            # the parts hold steps selected time steps each, from the first
+            # to the last of them
+            while begin < num_time_steps:
+                end = begin + steps - 1
+                if end > num_time_steps - 1:
+                    end = num_time_steps - 1
+                if node_block is None:
+                    outputfilename = basename + '_part'+ str(i) + '.seq'
+                    parts.append((outdir, outputfilename, selected[begin], selected[end]))
+                else:
+                    for k, nodes in enumerate(nodeblocks):
+                        outputfilename = basename + '_part'+ str(i) + '_block' + str(k) + '.seq'
+                        parts.append((outdir, outputfilename, selected[begin], selected[end], nodes))
+                begin = begin + steps
+                i = i + 1
+        
+            todo = [part for part in parts if part[1] not in keep]
+            if workers > 1 and len(todo) > 1:
+                # the part files are independent, every worker opens the exodus
+                # file itself and reads its own time slices
+                pool = multiprocessing.Pool(min(workers, len(todo)), _init_worker,
+                    (inputfile, varindex, writeropts))
+                try:
+                    written = []
+                    for partoffsets, partstats in pool.map(_write_part, todo, 1):
+                        written.append(partoffsets)
+                        stats.update(Stats(**partstats))
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                written = [partwriter.write(*part) for part in todo]
+            offsets = dict(zip([part[1] for part in todo], written))
+            counts = [len(xrange(part[2], part[3]+1, stride)) for part in parts]
+    except ex.QuantizeError, e:
+        # a field with NaN or inf, the dataset gets no index.seq
+        print >> sys.stderr, 'Cannot quantize', inputfile+':', e
+        indexwriter.close()
+        os.remove(os.path.join(outdir,'index.seq'))
+        return False
+    
+    stats.count('parts_kept', len([part for part in parts if part[1] in keep]))
+    t1 = time.time()
+    
+    # the manifest of the files, for a rerun
+    files = {}
+    if coords == 'shared':
+        files[ex.COORDS_FILE] = keep.get(ex.COORDS_FILE) or \
+            ex.manifest_entry(os.path.join(outdir,ex.COORDS_FILE))
+    for part in parts:
+        if part[1] in keep:
+            files[part[1]] = keep[part[1]]
+        else:
+            nodes = None
+            if len(part) > 4:
+                nodes = part[4]
+            files[part[1]] = ex.manifest_entry(os.path.join(outdir,part[1]),
+                steps=(part[2], part[3]), nodes=nodes, offsets=offsets[part[1]])
+    
+    # the index is written in order of the parts
+    for part, count in zip(parts, counts):
+        indexkey.set(part[1])
+        if node_block is None:
+            indexvalue.set(count)
+        else:
+            # the time and node ranges of the tile
+            indexvalue.set((count, (part[2], part[3]), part[4]))
+        indexwriter.append(indexkey,indexvalue)
+    
+    if encoding != 'plain':
+        indexkey.set('encoding')
+        indexvalue.set(encoding)
+        indexwriter.append(indexkey,indexvalue)
+    if compression != 'record':
+        indexkey.set('compression')
+        indexvalue.set(compression)
+        indexwriter.append(indexkey,indexvalue)
+    if coords == 'shared':
+        indexkey.set('coords')
+        indexvalue.set(ex.COORDS_FILE)
+        indexwriter.append(indexkey,indexvalue)
+    if layout != 'time-major':
+        indexkey.set('layout')
+        indexvalue.set(layout)
+        indexwriter.append(indexkey,indexvalue)
+    if node_block is not None:
+        indexkey.set('node_block')
+        indexvalue.set(node_block)
+        indexwriter.append(indexkey,indexvalue)
+    # the step and time ranges and record offsets of the parts
+    ex.write_offsets(outdir, [(part[1], files[part[1]]) for part in parts],
+        partwriter.timearray, compression)
+    if time_range is not None or stride != 1:
+        # the selection as a slice of the time steps of the exodus file
+        indexkey.set('time_range')
+        indexvalue.set((start, stop, stride))
+        indexwriter.append(indexkey,indexvalue)
+    if delta:
+        indexkey.set('delta')
+        indexvalue.set({'shuffle': shuffle})
+        indexwriter.append(indexkey,indexvalue)
+    if quantize is not None:
+        indexkey.set('precision')
+        indexvalue.set({'quantize': float(quantize), 'scale': 2.0*quantize})
+        indexwriter.append(indexkey,indexvalue)
+    elif dtype is not None:
+        indexkey.set('precision')
+        indexvalue.set({'dtype': dtype})
+        indexwriter.append(indexkey,indexvalue)
+        
+    indexkey.set('total')
+    indexvalue.set(num_time_steps)
+    indexwriter.append(indexkey,indexvalue)   
+    indexwriter.close()
+    
+    # a rerun checks that the indexes were uploaded in full
+    for fname in ('index.seq', ex.OFFSETS_FILE):
+        files[fname] = ex.manifest_entry(os.path.join(outdir,fname))
+    ex.write_manifest(outdir, config, files)
+    stats.add_time('index', time.time() - t1)
+    
+    fnames = [part[1] for part in parts if part[1] not in keep]
+    fnames += ['index.seq', ex.OFFSETS_FILE, ex.MANIFEST_FILE]
+    if coords == 'shared' and ex.COORDS_FILE not in keep:
+        fnames.append(ex.COORDS_FILE)
+    stats.count('bytes_written', sum([os.path.getsize(os.path.join(outdir,fname))
+        for fname in fnames]))
+    stats.count('steps', num_time_steps)
+    stats.add_time('convert', time.time() - t0)
+    return True
+
+def add_options(add_option):
+    """ Add the conversion options.
+    
+    @param add_option the add_option of an OptionParser or the
+        add_passthrough_option of an MRJob
+    """
+    add_option(
+        '-t', '--timesteps', dest='timesteps',
+        type='int',
+        help='-t NUM or --timesteps NUM, Groups the output into batches of NUM timesteps'
+    )
+    add_option(
+        '--part-bytes', dest='part_bytes',
+        help='--part-bytes SIZE, Groups the output into batches of timesteps whose node values fill SIZE bytes, e.g. 128M, instead of --timesteps. With --layout node-major the timesteps transposed at once fill SIZE bytes'
+    )
+    add_option(
+        '--time-range', dest='time_range',
+        help='--time-range START:END, Only output the timesteps START to END-1, negative numbers count from the end and either may be left out, as in a python slice'
+    )
+    add_option(
+        '--stride', dest='stride', default=1,
+        type='int',
+        help='--stride NUM, Only output every NUM-th timestep (default 1)'
+    )
+    add_option(
+        '--node-block', dest='node_block',
+        type='int',
+        help='--node-block NUM, Splits every batch of timesteps into tiles of NUM nodes'
+    )
+    add_option(
+        '--layout', dest='layout', default='time-major',
+        type='choice', choices=list(ex.LAYOUTS),
+        help='--layout LAYOUT, Write one record per timestep (time-major) or one record per --node-block of nodes over all timesteps (node-major) (default time-major)'
+    )
+    add_option(
+        '-d', '--outdir', dest='outdir',
+        help='-d DIR or --outdir DIR, Write the output to the directory DIR'
+    )
+    add_option(
+        '--variables', dest='variables',
+        help='--variables VARS, Only output the variables in the comma delimited list'
+    )
+    add_option(
+        '--elem-variables', dest='elem_variables',
+        help='--elem-variables VARS, Also output the element variables in the comma delimited list'
+    )
+    add_option(
+        '--elem-blocks', dest='elem_blocks',
+        help='--elem-blocks IDS, Only output the element variables of the blocks with the comma delimited ids (default all blocks)'
+    )
+    add_option(
+        '--global-variables', dest='global_variables',
+        help='--global-variables VARS, Also output the global variables in the comma delimited list'
+    )
+    add_option(
+        '--nodeset-variables', dest='nodeset_variables',
+        help='--nodeset-variables VARS, Also output the node set variables in the comma delimited list'
+    )
+    add_option(
+        '--workers', dest='workers', default=1,
+        type='int',
+        help='--workers NUM, Write the part files of a file with a pool of NUM processes (default 1)'
+    )
+    add_option(
+        '--coords', dest='coords', default='inline',
+        type='choice', choices=list(ex.COORDS),
+        help='--coords MODE, Write the coordinates into every part file (inline, the layout older readers expect) or once into coords.seq (shared) (default inline)'
+    )
+    add_option(
+        '--compression', dest='compression', default='record',
+        type='choice', choices=sorted(ex.COMPRESSION_TYPES),
+        help='--compression TYPE, The SequenceFile compression: none, record or block (default record)'
+    )
+    add_option(
+        '--encoding', dest='encoding', default='plain',
+        type='choice', choices=list(ex.ENCODINGS),
+        help='--encoding ENC, Write node values as plain lists of floats or as packed raw array buffers (default plain)'
+    )
+    add_option(
+        '--delta', dest='delta', default=False,
+        action='store_true',
+        help='--delta, Pack every timestep after the first of a part file as the exact difference to the timestep before, for smoothly varying fields, with --encoding packed'
+    )
+    add_option(
+        '--shuffle', dest='shuffle', default=False,
+        action='store_true',
+        help='--shuffle, Group the packed bytes by their position in a value so they compress better, with --encoding packed'
+    )
+    add_option(
+        '--dtype', dest='dtype',
+        type='choice', choices=list(ex.DTYPES),
+        help='--dtype TYPE, Write the node values as float32 or float64 instead of the word size of the exodus file, with --encoding packed'
+    )
+    add_option(
+        '--quantize', dest='quantize',
+        type='float',
+        help='--quantize TOL, Write the node values as integer multiples of 2*TOL, off by at most TOL, with --encoding packed, a file with NaN or infinite values then fails'
+    )
+    
+def load_options(options, error):
+    """ Check the options of add_options().
+    
+    @param options the parsed options
+    @param error the function that reports an invalid option and does
+        not return, such as the error of an OptionParser
+    @return a (steps, outdir, variables, kwargs) tuple of the arguments
+        of convert(), steps is None with --part-bytes
+    """
+    part_bytes = None
+    if options.part_bytes is not None:
+        if options.timesteps is not None:
+            error('You cannot specify both --timesteps and --part-bytes')
+        try:
+            part_bytes = ex.parse_size(options.part_bytes)
+        except ValueError:
+            error('Invalid --part-bytes %s'%(options.part_bytes))
+    elif options.timesteps is None:
+        error('You must specify the --timesteps NUM or -t NUM')
+    if options.outdir is None:
+        error('You must specify the --outdir DIR or -d DIR')
+    if options.variables is None:
+        error('You must specify the --variables VARS')
+        
+    if options.node_block is not None and options.node_block < 1:
+        error('--node-block must be at least 1')
+    if options.layout == 'node-major' and options.node_block is None:
+        error('You must specify the --node-block NUM with --layout node-major')
+    time_range = None
+    if options.time_range is not None:
+        try:
+            time_range = ex.parse_time_range(options.time_range)
+        except ValueError:
+            error('Invalid --time-range %s'%(options.time_range))
+    if options.stride < 1:
+        error('--stride must be at least 1')
+    if options.elem_blocks is not None:
+        try:
+            ex.parse_ids(options.elem_blocks)
+        except ValueError:
+            error('Invalid --elem-blocks %s'%(options.elem_blocks))
+    if (options.delta or options.shuffle) and options.encoding != 'packed':
+        error('You must specify --encoding packed with --delta or --shuffle')
+    if options.delta and options.layout != 'time-major':
+        error('You cannot specify --delta with --layout node-major')
+    if (options.elem_variables or options.nodeset_variables) and options.layout != 'time-major':
+        error('You cannot specify --elem-variables or --nodeset-variables with --layout node-major')
+    if options.dtype is not None and options.quantize is not None:
+        error('You cannot specify both --dtype and --quantize')
+    if (options.dtype is not None or options.quantize is not None) and options.encoding != 'packed':
+        error('You must specify --encoding packed with --dtype or --quantize')
+    if options.quantize is not None and options.quantize <= 0:
+        error('--quantize must be positive')
+        
+    kwargs = dict(encoding=options.encoding, coords=options.coords,
+        workers=options.workers, part_bytes=part_bytes,
+        node_block=options.node_block, layout=options.layout,
+        compression=options.compression,
+        time_range=time_range, stride=options.stride,
+        elem_variables=options.elem_variables, elem_blocks=options.elem_blocks,
+        global_variables=options.global_variables,
+        nodeset_variables=options.nodeset_variables,
+        delta=options.delta, shuffle=options.shuffle, dtype=options.dtype,
+        quantize=options.quantize)
+    steps = None
+    if part_bytes is None:
+        steps = options.timesteps
+    return steps, options.outdir, options.variables, kwargs
+    
+def _convert_file(task):
+    """ Convert a file in a process of run_local(), return (path, result). """
+    path, steps, outdir, variables, kwargs = task
+    stats = Stats()
+    result = 1
+    try:
+        if convert(path, steps, outdir, variables, subdir=True, stats=stats, **kwargs):
+            result = 0
+    except Exception:
+        print >> sys.stderr, 'Converting', path, 'failed:'
+        traceback.print_exc()
+    write_report(outdir, path, result, stats)
+    return path, result
+    
+def run_local(paths, steps, outdir, variables, processes=None, **kwargs):
+    """ Convert exodus files on the local machine with a process pool.
+    
+    Every file is written to a directory of outdir named after it, an
+    earlier conversion there is resumed, and the Stats of its conversion
+    to <name>.stats.json next to it.  A file that is listed twice is
+    converted once.
+    
+    @param paths the exodus files
+    @param processes the number of processes, the number of cores by
+        default
+    @param kwargs the keyword arguments of convert()
+    @return a list of (path, result) tuples in the order of paths, the
+        result is 0 if the file was converted and 1 if not
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    unique = []
+    for path in paths:
+        if path not in unique:
+            unique.append(path)
+    tasks = [(path, steps, outdir, variables, kwargs) for path in unique]
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            return pool.map(_convert_file, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    return [_convert_file(task) for task in tasks]
+    
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] INPUT')
+    add_options(parser.add_option)
+    parser.add_option(
+        '--processes', dest='processes',
+        type='int',
+        help='--processes NUM, Convert NUM files at a time (default the number of cores)'
+    )
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('You must specify the INPUT file with the list of exodus files')
+    steps, outdir, variables, kwargs = load_options(options, parser.error)
+    if options.processes is not None and options.processes < 1:
+        parser.error('--processes must be at least 1')
+    if options.workers > 1 and options.processes != 1:
+        parser.error('You must specify --processes 1 with --workers')
+        
+    f = open(args[0])
+    try:
+        paths = [line.strip() for line in f if line.strip()]
+    finally:
+        f.close()
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    results = run_local(paths, steps, outdir, variables, options.processes, **kwargs)
+    for path, result in results:
+        print '%s\t%s'%(json.dumps(path), json.dumps(result))
+    failed = len([result for path, result in results if result != 0])
+    print >> sys.stderr, '%i of %i files converted'%(len(results) - failed, len(results))
+    if failed:
+        return 1
+    return 0
+    
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+
+"""
+exodus2seq_reader.py
+====================
+
+Random access to a dataset written by the exodus to sequence file
+converters, the directory with index.seq and the part files.
+
+    ds = Dataset('data/run1')
+    time, values = ds.get_step(10)
+    for step, time, values in ds.get_time_range(0.5, 1.5):
+        ...
+
+values is a list of (name, array) tuples in the order of the part
+files' records.  The node values of tiles and node blocks are joined
+into one array over all nodes.
+
+With _offsets.seq the reader seeks straight to the record of a time step.
+Without it, for datasets of older converters or with block compression,
+the part file with the time step is scanned from its start.  The time
+steps of a delta encoded part file are added up from its first time step,
+so get_step() reads the part up to the time step.  Quantized node values
+are decoded to float64, Dataset.precision tells the tolerance.
+
+To read a whole dataset, iter_blocks() decodes it into numpy arrays of
+time steps by nodes, one block at a time:
+
+    for block in ds.iter_blocks(['TEMP']):
+        temp = dict(block.values)['TEMP']
+"""
+
+import os
+import itertools
+
+import numpy as np
+
+from hadoop.io import SequenceFile
+from hadoop.typedbytes import TypedBytesWritable
+
+import exodus2seq as ex
+
+def _records(path, offset=None):
+    """ The (key, value) records of a sequence file.
+
+    @param offset the byte offset to seek to first, None to read from
+        the start
+    """
+    reader = SequenceFile.Reader(path)
+    try:
+        if offset is not None:
+            reader.seek(offset)
+        key = TypedBytesWritable()
+        value = TypedBytesWritable()
+        while reader.next(key, value):
+            yield key.get(), value.get()
+    finally:
+        reader.close()
+
+def _is_step(key):
+    """ Whether a record key is the (step, time) key of a time step. """
+    return isinstance(key, tuple) and len(key) == 2 and isinstance(key[1], float)
+
+def _is_extra(name):
+    """ Whether a value is of an element, global or node set variable,
+    rather than of a node variable. """
+    return name.split(':')[0] in ('elem', 'glo', 'nset') and ':' in name
+
+def _join(tiles):
+    """ Join the (name, array) lists of the tiles of a time step.
+
+    The arrays of a name that is in several tiles are concatenated
+    along the first axis, the nodes.
+    """
+    names = []
+    arrays = {}
+    for values in tiles:
+        for name, data in values:
+            if name not in arrays:
+                names.append(name)
+                arrays[name] = []
+            arrays[name].append(data)
+    joined = []
+    for name in names:
+        if len(arrays[name]) == 1:
+            joined.append((name, arrays[name][0]))
+        else:
+            joined.append((name, np.concatenate(arrays[name])))
+    return joined
+
+class Part(object):
+    """ A part file of a dataset. """
+    def __init__(self, name, steps, times=None, offsets=None, nodes=None):
+        """
+        @param steps the (first, last) time steps of the part
+        @param times the (first, last) time values, None if unknown
+        @param offsets the byte offsets of the time step records, or of
+            the node-major record, empty if unknown
+        @param nodes the (first, last) nodes of a tile or node block
+        """
+        self.name = name
+        self.steps = tuple(steps)
+        self.times = times
+        self.offsets = offsets or []
+        self.nodes = nodes
+
+class Dataset(object):
+    """ A converted dataset on the local file system. """
+    def __init__(self, dirname):
+        """
+        @param dirname the directory with index.seq
+        """
+        self.dirname = dirname
+        self.info = {}
+        index = []
+        for key, value in _records(os.path.join(dirname, 'index.seq')):
+            if isinstance(key, str) and key.endswith('.seq'):
+                index.append((key, value))
+            else:
+                self.info[key] = value
+        self.layout = self.info.get('layout', 'time-major')
+        self.stride = 1
+        if 'time_range' in self.info:
+            self.stride = self.info['time_range'][2]
+        self.delta = 'delta' in self.info
+        # the dtype or quantization tolerance of the node values
+        self.precision = self.info.get('precision', {})
+
+        ranges = {}
+        # older datasets name the offsets index in index.seq
+        offsets = self.info.get('offsets', ex.OFFSETS_FILE)
+        if os.path.isfile(os.path.join(dirname, offsets)):
+            for key, value in _records(os.path.join(dirname, offsets)):
+                ranges[key] = value
+
+        self.parts = []
+        first = 0
+        for name, value in index:
+            nodes = None
+            if isinstance(value, tuple):
+                # a tile or a node block
+                count, steps, nodes = value
+            else:
+                count = value
+                steps = (first, first + count - 1)
+                first += count
+            if name in ranges:
+                steps, times, offsets = ranges[name]
+                self.parts.append(Part(name, steps, times, offsets, nodes))
+            else:
+                self.parts.append(Part(name, steps, nodes=nodes))
+
+    def _groups(self):
+        """ The parts grouped by their time steps, the tiles of a group
+        are in node order. """
+        groups = []
+        for part in self.parts:
+            if groups and groups[-1][0].steps == part.steps:
+                groups[-1].append(part)
+            else:
+                groups.append([part])
+        return groups
+
+    def _position(self, part, step):
+        """ The position of a time step among the time steps of a part,
+        None if the part does not have it. """
+        first, last = part.steps
+        if step < first or step > last or (step - first) % self.stride != 0:
+            return None
+        return (step - first)//self.stride
+
+    def _step_records(self, part, position=0):
+        """ The time step records of a part, from the one at position. """
+        path = os.path.join(self.dirname, part.name)
+        if part.offsets:
+            records = _records(path, part.offsets[position])
+        else:
+            records = _records(path)
+            records = (record for record in records if _is_step(record[0]))
+            for i in xrange(position):
+                records.next()
+        return (record for record in records if _is_step(record[0]))
+
+    def _decoded_steps(self, part, position=0):
+        """ The time steps of a part from the one at position, as (key,
+        values) tuples of the decoded (name, array) values. """
+        if not self.delta:
+            for key, value in self._step_records(part, position):
+                yield key, ex.decode_values(value)
+            return
+        # every difference needs the time step before
+        values = None
+        for i, (key, value) in enumerate(self._step_records(part)):
+            values = ex.decode_values(value, values)
+            if i >= position:
+                yield key, values
+
+    def _node_block(self, part):
+        """ The time values and the (name, array) values of a node-major
+        part file. """
+        times = None
+        for key, value in _records(os.path.join(self.dirname, part.name)):
+            if key == 'time':
+                times = ex.decode_array(value)
+            elif isinstance(key, tuple) and not _is_step(key):
+                return times, ex.decode_values(value)
+        raise IOError('%s has no node block record'%(part.name))
+
+    def get_step(self, step):
+        """ Read a single time step.
+
+        @param step the time step number of the exodus file
+        @return a (time, values) tuple
+        @raise KeyError if the dataset does not have the time step
+        """
+        for group in self._groups():
+            position = self._position(group[0], step)
+            if position is None:
+                continue
+            tiles = []
+            time = None
+            for part in group:
+                if self.layout == 'node-major':
+                    times, values = self._node_block(part)
+                    time = float(times[position])
+                    tiles.append([(name, data[..., position]) for name, data in values])
+                else:
+                    key, values = self._decoded_steps(part, position).next()
+                    time = key[1]
+                    tiles.append(values)
+            return time, _join(tiles)
+        raise KeyError('time step %i is not in the dataset'%(step))
+
+    def get_time_range(self, t0, t1):
+        """ Read the time steps with a time value in [t0, t1].
+
+        Parts whose time values are known to be outside the range are
+        not read.
+
+        @return a generator of (step, time, values) tuples
+        """
+        for group in self._groups():
+            times = group[0].times
+            if times is not None and (max(times) < t0 or min(times) > t1):
+                continue
+            if self.layout == 'node-major':
+                blocks = [self._node_block(part) for part in group]
+                first = group[0].steps[0]
+                for position, time in enumerate(blocks[0][0]):
+                    if t0 <= time <= t1:
+                        tiles = [[(name, data[..., position]) for name, data in values]
+                            for times, values in blocks]
+                        yield first + position*self.stride, float(time), _join(tiles)
+            else:
+                for steps in itertools.izip(*[self._decoded_steps(part) for part in group]):
+                    step, time = steps[0][0]
+                    if t0 <= time <= t1:
+                        yield step, time, _join([values for key, values in steps])
+
+    def coordinates(self):
+        """ Read the node coordinates.
+
+        @return a list of (key, array) tuples, the keys are -1, -2 and
+            -3 for x, y and z
+        """
+        if 'coords' in self.info:
+            paths = [os.path.join(self.dirname, self.info['coords'])]
+        else:
+            paths = [os.path.join(self.dirname, part.name)
+                for part in self._groups()[0]]
+        tiles = []
+        for path in paths:
+            coords = []
+            for key, value in _records(path):
+                if not isinstance(key, int):
+                    break
+                coords.append((key, ex.decode_array(value)))
+            tiles.append(coords)
+        return _join(tiles)
+
+    def iter_blocks(self, variables=None):
+        """ Read the dataset in blocks of time steps by nodes.
+
+        Every value is copied straight into numpy arrays that are
+        allocated once per block, packed values in bulk from their
+        buffers and plain values from their lists, and not through
+        nested python lists.  A time-major dataset gives a block per
+        partition of time steps with all nodes, joining the tiles, a
+        node-major dataset gives a block per node block with all time
+        steps.
+
+        @param variables the names of the values to read, None for all
+        @return a generator of Block objects
+        """
+        for group in self._groups():
+            if self.layout == 'node-major':
+                for part in group:
+                    times, values = self._node_block(part)
+                    first = part.steps[0]
+                    steps = first + self.stride*np.arange(len(times))
+                    blockvalues = [(name, np.ascontiguousarray(data.T,
+                            dtype=data.dtype.newbyteorder('=')))
+                        for name, data in values
+                        if variables is None or name in variables]
+                    yield Block(steps, np.asarray(times, dtype=float),
+                        part.nodes, blockvalues)
+            else:
+                yield self._time_block(group, variables)
+
+    def _time_block(self, group, variables):
+        """ Read a group of time-major tiles into one Block. """
+        first, last = group[0].steps
+        nsteps = len(xrange(first, last+1, self.stride))
+        steps = np.empty(nsteps, dtype=np.int64)
+        times = np.empty(nsteps)
+        num_nodes = None
+        if group[0].nodes is not None:
+            num_nodes = max([part.nodes[1] for part in group]) + 1
+
+        names = []
+        arrays = {}
+        for part in group:
+            # the arrays of the previous time step, for delta encoding
+            previous = {}
+            for i, (key, value) in enumerate(self._step_records(part)):
+                steps[i], times[i] = key
+                for name, data in value:
+                    if variables is not None and name not in variables:
+                        continue
+                    tiled = part.nodes is not None and not _is_extra(name)
+                    if name not in arrays:
+                        if isinstance(data, tuple):
+                            # packed, the native byte order of its dtype
+                            dtype = ex.packed_dtype(data).newbyteorder('=')
+                            shape = tuple(data[1])
+                        elif isinstance(data, np.ndarray):
+                            dtype = data.dtype.newbyteorder('=')
+                            shape = data.shape
+                        else:
+                            dtype = np.float64
+                            shape = np.shape(data)
+                        if tiled:
+                            shape = (num_nodes,) + shape[1:]
+                        names.append(name)
+                        arrays[name] = np.empty((nsteps,) + shape, dtype=dtype)
+                    if isinstance(data, tuple):
+                        data = ex.unpack_array(data, previous.get(name))
+                        if self.delta:
+                            previous[name] = data
+                    if tiled:
+                        arrays[name][i,part.nodes[0]:part.nodes[1]+1] = data
+                    else:
+                        arrays[name][i] = data
+        nodes = None
+        if num_nodes is not None:
+            nodes = (0, num_nodes - 1)
+        return Block(steps, times, nodes, [(name, arrays[name]) for name in names])
+
+class Block(object):
+    """ A block of a dataset.
+
+    steps and times are the time step numbers and time values of the
+    block, values is a list of (name, array) tuples.  The arrays of the
+    node variables are (time steps x nodes) and those of the element,
+    global and node set variables (time steps x elements), (time steps)
+    and (time steps x nodes of the set).
+    """
+    def __init__(self, steps, times, nodes, values):
+        """
+        @param nodes the (first, last) nodes of the node variables, None
+            for all nodes
+        """
+        self.steps = steps
+        self.times = times
+        self.nodes = nodes
+        self.values = values
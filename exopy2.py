@@ -7,7 +7,13 @@ import numpy as np
 try:
     import Scientific.IO.NetCDF as netcdf
 except ImportError:
-    import pynetcdf as netcdf    
+    try:
+        import pynetcdf as netcdf    
+    except ImportError:
+        # only the memory mapped reader is available
+        netcdf = None
+
+import netcdf3
 
 """
 exopy2.py
@@ -16,22 +22,42 @@ exopy2.py
 
 __author__ = 'David F. Gleich'
 
+BACKENDS = ('mmap', 'netcdf')
+
 class ExoFile(object):
     """ A low-level interface to an exodus file.  This class is
     a somewhat thin-wrapper around the NetCDFFile class, that stores
     many of the constants that the exodus datatype uses. """
-    def __init__(self,filename,attrs='r'):
+    def __init__(self,filename,attrs='r',backend='mmap'):
         """ 
         @param filename the name of the exodus file 
         @param attrs the file type attributes:
             'r' - read only (filename must exist)
             'a' - append/new file
             'w' - new file (erases any existing contents)
+        @param backend how to read the file:
+            'mmap' - memory map a netCDF-3 file with netcdf3, the
+                variables are views on the file and not copies
+            'netcdf' - use Scientific.IO.NetCDF or pynetcdf
+            Files are always written with the netcdf backend, and a
+            file that is not netCDF-3 is read with it too.
         """
         self.filename = filename
-        self.cdf = netcdf.NetCDFFile(filename,attrs)
+        self.cdf = None
+        if attrs == 'r' and backend == 'mmap':
+            try:
+                self.cdf = netcdf3.NetCDFFile(filename,attrs)
+            except netcdf3.FormatError:
+                if netcdf is None:
+                    raise
+        if self.cdf is None:
+            if netcdf is None:
+                raise ImportError('the netcdf backend needs Scientific.IO.NetCDF or pynetcdf')
+            self.cdf = netcdf.NetCDFFile(filename,attrs)
         self.dims = self.cdf.dimensions
         self.vars = self.cdf.variables
+        # the names and records, decoded on first use
+        self._cache = {}
         
     def _maxlines(self,list,n):
         """ A utility routine to help show a synopsis of a exodus file. """
@@ -131,12 +157,16 @@ class ExoFile(object):
         doc="number of nodes in the model"))
     num_dim = property(**_dims_property("num_dim",
         doc="number of nodes in the model"))
-    num_elem = property(**_dims_property("num_nodes",
-        doc="number of nodes in the model"))
+    num_elem = property(**_dims_property("num_elem",
+        doc="number of elements in the model"))
+    num_el_blk = property(**_dims_property("num_el_blk",
+        doc="number of element blocks"))
     num_glo_var = property(**_dims_property("num_glo_var",
-        doc="number of nodes in the model"))
+        doc="number of global variables"))
     num_nod_var = property(**_dims_property("num_nod_var",
-        doc="number of nodes in the model"))
+        doc="number of node variables"))
+    num_elem_var = property(**_dims_property("num_elem_var",
+        doc="number of element variables"))
     
     len_string = property(**_dims_property("len_string",
         doc="length of string types"))
@@ -159,36 +189,247 @@ class ExoFile(object):
     def time_steps(self):
         return self.vars['time_whole'].getValue()
     
-    def global_variables_names(self):
-        names = self.vars['name_glo_var'].getValue()
+    def _cached(self, key, read):
+        """ Read a piece of metadata once and keep it.
+        
+        @param key the name of the cached value
+        @param read a function that reads the value from the file
+        """
+        if key not in self._cache:
+            self._cache[key] = read()
+        return self._cache[key]
+        
+    def _names(self, varname):
+        """ Decode a character array variable into a list of strings. """
+        names = self.vars[varname].getValue()
         return [n.tostring().rstrip('\x00') for n in names]
+    
+    def _index(self, varname, name):
+        """ Return the index of name in a name table, or None if it is
+        not there.  The first of duplicate names is used. """
+        def read():
+            index = {}
+            for i, n in enumerate(self._cached(varname,
+                    lambda: self._names(varname))):
+                index.setdefault(n, i)
+            return index
+        return self._cached(varname + '_index', read).get(name)
+        
+    def _ids(self, varname):
+        """ The ids of the blocks or sets in a property variable. """
+        return list(self._cached(varname,
+            lambda: [int(i) for i in self.vars[varname].getValue()]))
+        
+    def global_variables_names(self):
+        return list(self._cached('name_glo_var',
+            lambda: self._names('name_glo_var')))
+        
+    def global_variable_index(self, name):
+        """ Return the index of a global variable, or None. """
+        return self._index('name_glo_var', name)
+        
+    def global_variable(self, name):
+        """ Return the values of a global variable, indexed by time step. """
+        index = self.global_variable_index(name)
+        if index is None:
+            raise KeyError('no global variable %s'%(name))
+        return self.vars['vals_glo_var'][:,index]
         
     def node_variable_names(self):
-        names = self.vars['name_nod_var'].getValue()
-        return [n.tostring().rstrip('\x00') for n in names]
+        return list(self._cached('name_nod_var',
+            lambda: self._names('name_nod_var')))
+        
+    def node_variable_index(self, name):
+        """ Return the index of a node variable, or None if there is no
+        variable with the name.  The first of duplicate names is used. """
+        return self._index('name_nod_var', name)
+        
+    def node_variable(self, name):
+        """ Return the netcdf variable with the values of a node variable,
+        indexed by time step and node. """
+        index = self.node_variable_index(name)
+        if index is None:
+            raise KeyError('no node variable %s'%(name))
+        return self.vars['vals_nod_var%i'%(index+1)]
+        
+    def element_block_ids(self):
+        """ Return the ids of the element blocks, in the file order. """
+        return self._ids('eb_prop1')
+        
+    def element_variable_names(self):
+        return list(self._cached('name_elem_var',
+            lambda: self._names('name_elem_var')))
+        
+    def element_variable_index(self, name):
+        """ Return the index of an element variable, or None. """
+        return self._index('name_elem_var', name)
+        
+    def element_variable(self, name, block_id):
+        """ Return the netcdf variable with the values of an element
+        variable in a block, indexed by time step and element.  A
+        variable that the truth table leaves out of the block raises a
+        KeyError. """
+        index = self.element_variable_index(name)
+        if index is None:
+            raise KeyError('no element variable %s'%(name))
+        ids = self.element_block_ids()
+        if block_id not in ids:
+            raise KeyError('no element block %i'%(block_id))
+        varname = 'vals_elem_var%ieb%i'%(index+1, ids.index(block_id)+1)
+        if varname not in self.vars:
+            raise KeyError('element variable %s is not in block %i'%(name, block_id))
+        return self.vars[varname]
+        
+    def node_set_ids(self):
+        """ Return the ids of the node sets, in the file order. """
+        return self._ids('ns_prop1')
+        
+    def node_set_variable_names(self):
+        return list(self._cached('name_nset_var',
+            lambda: self._names('name_nset_var')))
+        
+    def node_set_variable_index(self, name):
+        """ Return the index of a node set variable, or None. """
+        return self._index('name_nset_var', name)
+        
+    def node_set_variable(self, name, set_id):
+        """ Return the netcdf variable with the values of a node set
+        variable in a set, indexed by time step and node of the set. """
+        index = self.node_set_variable_index(name)
+        if index is None:
+            raise KeyError('no node set variable %s'%(name))
+        ids = self.node_set_ids()
+        if set_id not in ids:
+            raise KeyError('no node set %i'%(set_id))
+        varname = 'vals_nset_var%ins%i'%(index+1, ids.index(set_id)+1)
+        if varname not in self.vars:
+            raise KeyError('node set variable %s is not in set %i'%(name, set_id))
+        return self.vars[varname]
         
     def coordinate_names(self):
-        namedata = self.vars['coor_names'].getValue()
-        names = [n.tostring().rstrip('\x00') for n in namedata]
-        assert(len(names) == self.num_dim)
-        return names
+        def read():
+            names = self._names('coor_names')
+            assert(len(names) == self.num_dim)
+            return names
+        return list(self._cached('coor_names', read))
         
     def qa_records(self):
-        recdata = self.vars['qa_records'].getValue()
-        recs = []
-        for i in xrange(self.num_qa_rec):
-            r = []
-            for j in xrange(self.num_qa_strings):
-                r.append(recdata[i][j].tostring().rstrip('\x00'))
-            recs.append(r)
-        return recs
+        def read():
+            recdata = self.vars['qa_records'].getValue()
+            recs = []
+            for i in xrange(self.num_qa_rec):
+                r = []
+                for j in xrange(self.num_qa_strings):
+                    r.append(recdata[i][j].tostring().rstrip('\x00'))
+                recs.append(r)
+            return recs
+        return [list(r) for r in self._cached('qa_records', read)]
     
     def info_records(self):
-        infodata = self.vars['info_records'].getValue()
-        info = [d.tostring().rstrip('\x00') for d in infodata]
-        assert(len(info) == self.num_info)
-        return info
+        def read():
+            info = self._names('info_records')
+            assert(len(info) == self.num_info)
+            return info
+        return list(self._cached('info_records', read))
+
+def _chars(strings, length):
+    """ A (len(strings) x length) character array of padded strings. """
+    data = np.zeros((len(strings), length), dtype='S1')
+    for i, s in enumerate(strings):
+        data[i,:len(s)] = list(s)
+    return data
+
+def write_synthetic(filename, num_nodes, num_time_steps, num_vars, word_size=8):
+    """ Write a synthetic exodus II file in the classic netCDF format.
+    
+    The file has the time values, the x/y/z coordinates of random nodes
+    in the unit cube and the node variables VAR0, VAR1, ... that vary
+    smoothly over the nodes and a little from one time step to the
+    next.  It is written with netcdf3.NetCDFWriter one time step at a
+    time, so it needs no netCDF library and may be larger than memory.
+    
+    @param filename the name of the new file
+    @param num_nodes the number of nodes
+    @param num_time_steps the number of time steps
+    @param num_vars the number of node variables
+    @param word_size the floating point word size, 4 or 8
+    @return the names of the node variables
+    """
+    typecode = {4: 'f', 8: 'd'}[word_size]
+    names = ['VAR%i'%(i) for i in xrange(num_vars)]
+    
+    w = netcdf3.NetCDFWriter(filename)
+    w.set_attribute('title', 'synthetic benchmark data')
+    w.set_attribute('version', np.array([5.1], dtype=np.float32))
+    w.set_attribute('api_version', np.array([5.1], dtype=np.float32))
+    w.set_attribute('floating_point_word_size', np.array([word_size], dtype=np.int32))
+    w.set_attribute('file_size', np.array([1], dtype=np.int32))
+    
+    w.create_dimension('time_step', None)
+    w.create_dimension('len_string', 33)
+    w.create_dimension('len_line', 81)
+    w.create_dimension('four', 4)
+    w.create_dimension('num_dim', 3)
+    w.create_dimension('num_nodes', num_nodes)
+    w.create_dimension('num_elem', num_nodes)
+    w.create_dimension('num_nod_var', num_vars)
+    w.create_dimension('num_info', 1)
+    w.create_dimension('num_qa_rec', 1)
+    
+    w.create_variable('coor_names', 'c', ('num_dim', 'len_string'))
+    w.create_variable('name_nod_var', 'c', ('num_nod_var', 'len_string'))
+    w.create_variable('info_records', 'c', ('num_info', 'len_line'))
+    w.create_variable('qa_records', 'c', ('num_qa_rec', 'four', 'len_string'))
+    for c in 'xyz':
+        w.create_variable('coord'+c, typecode, ('num_nodes',))
+    w.create_variable('time_whole', typecode, ('time_step',))
+    for v in xrange(num_vars):
+        w.create_variable('vals_nod_var%i'%(v+1), typecode, ('time_step', 'num_nodes'))
+    w.begin()
+    
+    w.put('coor_names', _chars(['x', 'y', 'z'], 33))
+    w.put('name_nod_var', _chars(names, 33))
+    w.put('info_records', _chars(['written by exopy2.write_synthetic'], 81))
+    w.put('qa_records', _chars(['synthetic', '1.0', '', ''], 33))
+    rng = np.random.RandomState(0)
+    coords = rng.rand(3, num_nodes)
+    for i, c in enumerate('xyz'):
+        w.put('coord'+c, coords[i])
+    phases = [coords[0]*(v+1) + coords[1] + coords[2] for v in xrange(num_vars)]
+    for j, time in enumerate(np.linspace(0., 1., num_time_steps)):
+        w.put('time_whole', time, record=j)
+        for v in xrange(num_vars):
+            w.put('vals_nod_var%i'%(v+1), np.sin(phases[v] + 0.01*j) + 0.001*j, record=j)
+    w.close()
+    return names
 
 if __name__=='__main__':
-    pass
-    # setup some sort of test case
+    if len(sys.argv) > 1:
+        for filename in sys.argv[1:]:
+            print repr(ExoFile(filename))
+        sys.exit(0)
+    # write a small synthetic file and read it back
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp(prefix='exopy2')
+    try:
+        filename = os.path.join(tmpdir, 'synthetic.e')
+        for word_size in (4, 8):
+            names = write_synthetic(filename, 100, 7, 3, word_size)
+            f = ExoFile(filename)
+            assert f.num_nodes == 100 and f.num_time_steps == 7
+            assert f.floating_point_word_size == word_size
+            assert f.node_variable_names() == names
+            assert f.coordinate_names() == ['x', 'y', 'z']
+            assert np.allclose(f.time_steps(), np.linspace(0., 1., 7))
+            coords = np.random.RandomState(0).rand(3, 100)
+            x = f.vars['coordx'].getValue()
+            assert np.allclose(x, coords[0])
+            values = f.node_variable('VAR2')[6]
+            expect = np.sin(coords[0]*3 + coords[1] + coords[2] + 0.06) + 0.006
+            assert np.allclose(values, expect, atol=1e-6)
+            print repr(f)
+            f.cdf.close()
+        print 'ok'
+    finally:
+        shutil.rmtree(tmpdir)
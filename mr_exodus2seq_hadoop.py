@@ -7,6 +7,7 @@ History
 -------
 :2012-06-22: avoid PICKLE type code
 :2012-08-09: fix the bugs if tasks fail 
+:2026-10-17: convert to python floats with tolist() instead of per element
 
 Example(on ICME Hadoop):
 
@@ -20,129 +21,70 @@ __author__ = 'Yangyang Hou <hyy.sun@gmail.com>'
 
 import sys
 import os
-from subprocess import call, check_call
+import Queue
+import posixpath
+import threading
+from subprocess import call
 
 from mrjob.job import MRJob
 
-import exopy2 as ep
+import exodus2seq as ex
+import exodus2seq_convert as ec
+import storage as st
 
-from hadoop.io import SequenceFile
-from hadoop.io.SequenceFile import CompressionType
-from hadoop.typedbytes import *
+from exodus2seq_convert import convert
 
-def convert(inputfile, steps, outdir, variables):
-    f = ep.ExoFile(inputfile,'r')
-    total_time_steps = f.num_time_steps
-
-    if total_time_steps < steps:
-        print >> sys.stderr, 'The total time steps is', total_time_steps
-        print >> sys.stderr, 'The patitions step is',steps,'. No need to patition the file.'
-        return False
-        
-    Vars = variables.split(',')
-    
-    # Get time data and coordinate (x,y,z) data
-    time = f.cdf.variables["time_whole"]
-    timedata = time.getValue()
-    coordz = f.cdf.variables["coordz"]
-    zdata = coordz.getValue()
-    coordy = f.cdf.variables["coordy"]
-    ydata = coordy.getValue()
-    coordx = f.cdf.variables["coordx"]
-    xdata = coordx.getValue()
-    
-    # To avoid PICKLE type in typedbytes files
-    timedata2 = []
-    for i, ele in enumerate(timedata):
-        timedata2.append(float(ele))
-    xdata2 = []
-    for i, ele in enumerate(xdata):
-        xdata2.append(float(ele))
-    ydata2 = []
-    for i, ele in enumerate(ydata):
-        ydata2.append(float(ele))
-    zdata2 = []
-    for i, ele in enumerate(zdata):
-        zdata2.append(float(ele))
-    
-    # Get variable data
-    varnames = f.node_variable_names()
-    vardata = []
-    for i, var in enumerate(Vars):
-        vdata = None
-        for vi,n in enumerate(varnames):
-            if n == var.strip():
-                #vtemp = vi
-                vindex = vi
-                break
-        if vindex == None:
-            print  >> sys.stderr, 'The variable ', var.strip(), 'does not exist!'
-            return False
-        tmp = f.vars['vals_nod_var'+str(vindex+1)]
-        tmpdata = tmp.getValue()
-        vardata.append((var.strip(), tmpdata))
-    
-    # Begin to partition
-    basename = os.path.basename(inputfile)
-    ind = basename.rfind('.')
-    basename = basename[0:ind]
-    
-    indexkey = TypedBytesWritable()
-    indexvalue = TypedBytesWritable()
-    indexwriter = SequenceFile.createWriter(os.path.join(outdir,'index.seq'), 
-        TypedBytesWritable, TypedBytesWritable,compression_type=CompressionType.RECORD)
-    
-    begin = 0
-    i = 0
-    
-    while begin < total_time_steps:
-        end = begin + steps - 1
-        if end > total_time_steps - 1:
-            end = total_time_steps - 1
-        outputfilename = basename + '_part'+ str(i) + '.seq'
-        
-        writer = SequenceFile.createWriter(os.path.join(outdir,outputfilename),
-            TypedBytesWritable, TypedBytesWritable,compression_type=CompressionType.RECORD)
-        key = TypedBytesWritable()
-        value = TypedBytesWritable()
-        key.set(-1)
-        value.set(xdata2)
-        writer.append(key,value)
-        key.set(-2)
-        value.set(ydata2)
-        writer.append(key,value)
-        key.set(-3)
-        value.set(zdata2)
-        writer.append(key,value)
-        
-        for j in xrange(begin, end+1):
-            key.set((j,timedata2[j]))
-            valuedata = []
-            for m, var in enumerate(vardata):
-                name = var[0]
-                data = var[1][j]
-                data2 = []
-                for m, ele in enumerate(data):
-                    data2.append(float(ele))
-                valuedata.append((name,data2))
-            value.set(valuedata)
-            writer.append(key,value)
-        writer.close()
-        indexkey.set(outputfilename)
-        indexvalue.set(end-begin+1)
-        indexwriter.append(indexkey,indexvalue)
-        begin = begin + steps
-        i = i + 1
-        
-    indexkey.set('total')
-    indexvalue.set(total_time_steps)
-    indexwriter.append(indexkey,indexvalue)   
-    indexwriter.close()
-    
-    return True
-    
-    
+class DiskBudget(object):
+    """ The bytes of the local files of a pipeline, with a cap.
     
+    A file that does not fit is let through when nothing else is on the
+    local disk, so a single file larger than the cap is still converted.
+    """
+    def __init__(self, cap=None):
+        """
+        @param cap the number of bytes, None for no cap
+        """
+        self.cap = cap
+        self.used = 0
+        self.aborted = False
+        self.cond = threading.Condition()
+        
+    def reserve(self, nbytes):
+        """ Wait until nbytes more fit under the cap and take them.
+        
+        @return False if the pipeline was aborted meanwhile
+        """
+        self.cond.acquire()
+        try:
+            while (self.cap is not None and self.used > 0 and
+                    self.used + nbytes > self.cap and not self.aborted):
+                self.cond.wait()
+            self.used += nbytes
+            return not self.aborted
+        finally:
+            self.cond.release()
+            
+    def add(self, nbytes):
+        """ Account for nbytes more, or less, without waiting. """
+        self.cond.acquire()
+        try:
+            self.used += nbytes
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+            
+    def release(self, nbytes):
+        self.add(-nbytes)
+        
+    def abort(self):
+        """ Wake up a waiting reserve(). """
+        self.cond.acquire()
+        try:
+            self.aborted = True
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+        
 class MRExodus2Seq(MRJob):
 
     MRJob.HADOOP_INPUT_FORMAT = 'org.apache.hadoop.mapred.lib.NLineInputFormat'
@@ -151,71 +93,329 @@ class MRExodus2Seq(MRJob):
         """Add command-line options specific to this script."""
         super(MRExodus2Seq, self).configure_options()
         
+        ec.add_options(self.add_passthrough_option)
         self.add_passthrough_option(
-            '-t', '--timesteps', dest='timesteps',
-            type='int',
-            help='-t NUM or --timesteps NUM, Groups the output into batches of NUM timesteps'       
+            '--storage', dest='storage', default='shell',
+            type='choice', choices=list(st.STORAGES),
+            help='--storage KIND, Move files with batched hadoop fs commands (shell), an in-process WebHDFS client (webhdfs) or on the local file system (local) (default shell)'
+        )
+        self.add_passthrough_option(
+            '--storage-url', dest='storage_url',
+            help='--storage-url URL, The WebHDFS address of the namenode, e.g. http://namenode:50070, or the root directory of the local storage'
         )
         self.add_passthrough_option(
-            '-d', '--outdir', dest='outdir',
-            help='-d DIR or --outdir DIR, Write the output to the directory DIR'
+            '--storage-user', dest='storage_user',
+            help='--storage-user USER, The WebHDFS user name (default $USER)'
         )
         self.add_passthrough_option(
-            '--variables', dest='variables',
-            help='--variables VARS, Only output the variables in the comma delimited list'       
+            '--pipeline', dest='pipeline', default=False,
+            action='store_true',
+            help='--pipeline, Fetch the next file and upload the parts of the previous file while a file converts'
+        )
+        self.add_passthrough_option(
+            '--lines-per-mapper', dest='lines_per_mapper',
+            type='int',
+            help='--lines-per-mapper NUM, Give every mapper a batch of NUM input files, for --pipeline'
+        )
+        self.add_passthrough_option(
+            '--max-local-bytes', dest='max_local_bytes',
+            help='--max-local-bytes SIZE, With --pipeline only fetch the next file while the local files take at most SIZE bytes, e.g. 10G'
         )
        
     def load_options(self, args):
         super(MRExodus2Seq, self).load_options(args)
         
-        if self.options.timesteps is None:
-            self.option_parser.error('You must specify the --timesteps NUM or -t NUM')
-        else:
-            self.timesteps = self.options.timesteps
-            
-        if self.options.outdir is None:
-            self.option_parser.error('You must specify the --outdir DIR or -d DIR')
-        else:
-            self.outdir = self.options.outdir
-            
-        if self.options.variables is None:
-            self.option_parser.error('You must specify the --variables VARS')
-        else:
-            self.variables = self.options.variables
+        self.timesteps, self.outdir, self.variables, self.kwargs = \
+            ec.load_options(self.options, self.option_parser.error)
+        self.pipeline = self.options.pipeline
+        if self.options.lines_per_mapper is not None and self.options.lines_per_mapper < 1:
+            self.option_parser.error('--lines-per-mapper must be at least 1')
+        self.max_local_bytes = None
+        if self.options.max_local_bytes is not None:
+            try:
+                self.max_local_bytes = ex.parse_size(self.options.max_local_bytes)
+            except ValueError:
+                self.option_parser.error('Invalid --max-local-bytes %s'%(self.options.max_local_bytes))
+        try:
+            self.storage = st.open_storage(self.options.storage,
+                self.options.storage_url, self.options.storage_user)
+        except ValueError, e:
+            self.option_parser.error(str(e))
        
     
-    def mapper(self, _, line):
-        # step 0: strip off unexpected characters
-        line = line.split('\t')[1]
+    def jobconf(self):
+        jobconf = super(MRExodus2Seq, self).jobconf()
+        if self.options.lines_per_mapper is not None:
+            # the batch of files each mapper gets from NLineInputFormat
+            jobconf['mapred.line.input.format.linespermap'] = str(self.options.lines_per_mapper)
+        return jobconf
+    
+    def convert_options(self):
+        """ The keyword arguments of convert() given by the options. """
+        return dict(self.kwargs)
+            
+    def prepare(self, line):
+        """ Find what is left to do for an input line.
         
-        # step 1: fetch the exodus file from Hadoop cluster
+        @return (path, file, outdir, keep, source) for the exodus file
+            at path, source being its size and modification time, or
+            None if the whole file was converted already
+        """
+        # strip off unexpected characters
+        line = line.split('\t')[1]
         file = os.path.basename(line)
-        if os.path.isfile(os.path.join('./', file)):
-            call(['rm', os.path.join('./', file)])
-        check_call(['hadoop', 'fs', '-copyToLocal', line, os.path.join('./', file)])
         outdir = os.path.basename(line)
         ind = outdir.rfind('.')
         outdir = outdir[0:ind]
-        if os.path.isdir(os.path.join('./', outdir)):
-            call(['rm', '-r', os.path.join('./', outdir)])
-        call(['mkdir', os.path.join('./', outdir)])
-        
-        # step 2: do our local processing
-        result = convert(os.path.join('./', file), self.timesteps, os.path.join('./', outdir), self.variables)
-        
-        # step3: write back to Hadoop cluster
-        for fname in os.listdir(os.path.join('./', outdir)):
-            if call(['hadoop', 'fs', '-test', '-e', os.path.join(self.outdir,outdir,fname)]) == 0:
-                call(['hadoop', 'fs', '-rm', os.path.join(self.outdir,outdir,fname)])
-            call(['hadoop', 'fs', '-copyFromLocal', os.path.join('./',outdir,fname),os.path.join(self.outdir,outdir,fname)])
+        
+        # keep the files of an earlier attempt that are still valid, of
+        # the same exodus file
+        source = self.storage.status(line)
+        if source is None:
+            # fetch() reports the missing file
+            return (line, file, outdir, {}, None)
+        config = ex.manifest_config(self.timesteps, self.variables,
+            source=source, **self.convert_options())
+        manifest = ex.parse_manifest(
+            self.storage.cat(os.path.join(self.outdir,outdir,ex.MANIFEST_FILE)) or '')
+        keep = {}
+        if manifest is not None:
+            sizes = self.storage.sizes(os.path.join(self.outdir,outdir)) or {}
+            keep = ex.valid_files(manifest, config, sizes)
+            # index.seq is uploaded last, the indexes and every file of
+            # the manifest have their full size when a conversion is done
+            if (len(keep) == len(manifest['files']) and 'index.seq' in keep and
+                    ex.OFFSETS_FILE in keep):
+                return None
+        return (line, file, outdir, keep, source)
+        
+    def fetch(self, path, file, outdir, workdir='./'):
+        """ Fetch the exodus file from Hadoop cluster.
+        
+        @param workdir the local directory of the exodus file and of its
+            output directory
+        """
+        if not os.path.isdir(workdir):
+            call(['mkdir', workdir])
+        if os.path.isfile(os.path.join(workdir, file)):
+            call(['rm', os.path.join(workdir, file)])
+        self.storage.get(path, os.path.join(workdir, file))
+        if os.path.isdir(os.path.join(workdir, outdir)):
+            call(['rm', '-r', os.path.join(workdir, outdir)])
+        call(['mkdir', os.path.join(workdir, outdir)])
+        
+    def upload(self, outdir, workdir='./'):
+        """ Write the local files back to Hadoop cluster in one batch.
+        
+        The manifest goes first so a rerun can check the part files that
+        did make it, and index.seq last, so a dataset with index.seq is
+        complete.  put_dir removes the files it replaces before the
+        manifest is copied, and the indexes of an earlier conversion are
+        removed when a failed one wrote none, so no stale file of the same
+        size passes for one of the new manifest.
+        """
+        fnames = sorted(os.listdir(os.path.join(workdir, outdir)))
+        fnames.sort(key=lambda fname: (fname != ex.MANIFEST_FILE, fname == 'index.seq'))
+        for fname in ('index.seq', ex.OFFSETS_FILE):
+            if fname not in fnames:
+                self.storage.delete(os.path.join(self.outdir,outdir,fname))
+        self.storage.put_dir(os.path.join(workdir, outdir), os.path.join(self.outdir,outdir), fnames)
+        call(['rm', '-r', os.path.join(workdir, outdir)])
+        
+    def mapper_init(self):
+        self.lines = []
+        
+    def mapper(self, _, line):
+        if self.pipeline:
+            # the batch is converted by mapper_final
+            self.lines.append(line)
+            return
+            
+        # step 1: find the files that are missing
+        task = self.prepare(line)
+        if task is None:
+            # the whole file was converted already
+            self.increment_counter(ec.COUNTER_GROUP, 'files_skipped', 1)
+            yield (line.split('\t')[1], 0)
+            return
+        path, file, outdir, keep, source = task
+        stats = ec.Stats()
+        
+        # step 2: fetch the exodus file from Hadoop cluster
+        with stats.stage('fetch'):
+            self.fetch(path, file, outdir)
+        
+        # step 3: do our local processing, only for the missing files
+        result = convert(os.path.join('./', file), self.timesteps, os.path.join('./', outdir), self.variables,
+            keep=keep, stats=stats, source=source, **self.convert_options())
         call(['rm', os.path.join('./', file)])
-        call(['rm', '-r', os.path.join('./', outdir)])
         
-        #step 4: yield output key/value
+        # step 4: write back to Hadoop cluster
+        with stats.stage('upload'):
+            self.upload(outdir)
+        self.increment_counters(stats)
+        
+        #step 5: yield output key/value
         if result == True:
-            yield (line, 0)
+            yield (path, 0)
         else:
-            yield (line, 1)
+            yield (path, 1)
+            
+    def mapper_final(self):
+        if self.pipeline:
+            # every file is reported as soon as its upload completes, to
+            # keep the task alive over a long batch
+            for path, result, stats in self.run_pipeline(self.lines):
+                if stats is None:
+                    self.increment_counter(ec.COUNTER_GROUP, 'files_skipped', 1)
+                else:
+                    self.increment_counters(stats)
+                self.set_status('done %s'%(path))
+                yield (path, result)
+                
+    def increment_counters(self, stats):
+        """ Report the Stats of a file as counters. """
+        for name, amount in stats.counters():
+            self.increment_counter(ec.COUNTER_GROUP, name, amount)
+        
+    def run_pipeline(self, lines):
+        """ Convert the files of a batch of input lines with the transfers
+        overlapped.
+        
+        A thread fetches the next exodus file while the current one is
+        converted, another one uploads the parts of the previous file.
+        The queues between the stages hold one file each, and the next
+        file is only fetched while the local files stay within
+        --max-local-bytes.  Every file is staged in a local directory of
+        its own, named by its position in the batch, as input files of
+        the same name may be in the pipeline at once.
+        
+        @return a generator of (path, result, stats) tuples in the order
+            of lines, each given once the upload of the file completed,
+            stats is None for a file that was converted already
+        """
+        budget = DiskBudget(self.max_local_bytes)
+        fetched = Queue.Queue(1)
+        converted = Queue.Queue(1)
+        # the results of the uploads, None after the last one
+        done = Queue.Queue()
+        failed = []
+        
+        def fetch_all():
+            try:
+                sizes = {}
+                for index, line in enumerate(lines):
+                    if failed:
+                        break
+                    task = self.prepare(line)
+                    if task is None:
+                        fetched.put((line.split('\t')[1], None, None, None, None, None, 0, None))
+                        continue
+                    path, file, outdir, keep, source = task
+                    # one listing per input directory for the file sizes
+                    dirname = posixpath.dirname(path)
+                    if dirname not in sizes:
+                        sizes[dirname] = self.storage.sizes(dirname) or {}
+                    nbytes = sizes[dirname].get(file, 0)
+                    if not budget.reserve(nbytes):
+                        break
+                    stats = ec.Stats()
+                    workdir = os.path.join('./', 'line%i'%(index))
+                    with stats.stage('fetch'):
+                        self.fetch(path, file, outdir, workdir)
+                    fetched.put((path, workdir, file, outdir, keep, source, nbytes, stats))
+            except:
+                failed.append(sys.exc_info())
+                budget.abort()
+            fetched.put(None)
+            
+        def upload_all():
+            try:
+                while True:
+                    task = converted.get()
+                    if task is None:
+                        break
+                    path, workdir, outdir, result, nbytes, stats = task
+                    if failed:
+                        # only drain the queue
+                        continue
+                    try:
+                        if outdir is not None:
+                            with stats.stage('upload'):
+                                self.upload(outdir, workdir)
+                            call(['rm', '-r', workdir])
+                        budget.release(nbytes)
+                        done.put((path, result, stats))
+                    except:
+                        failed.append(sys.exc_info())
+                        budget.abort()
+            finally:
+                done.put(None)
+                
+        def convert_next():
+            """ Convert the next fetched file, False after the last. """
+            task = fetched.get()
+            if task is None:
+                return False
+            path, workdir, file, outdir, keep, source, nbytes, stats = task
+            if file is None:
+                # the whole file was converted already
+                converted.put((path, None, None, 0, 0, None))
+                return True
+            self.set_status('converting %s'%(path))
+            result = convert(os.path.join(workdir, file), self.timesteps, os.path.join(workdir, outdir), self.variables,
+                keep=keep, stats=stats, source=source, **self.convert_options())
+            call(['rm', os.path.join(workdir, file)])
+            # the exodus file is gone, its parts wait for the upload
+            outbytes = sum(ex.local_sizes(os.path.join(workdir, outdir)).values())
+            budget.add(outbytes - nbytes)
+            if result == True:
+                converted.put((path, workdir, outdir, 0, outbytes, stats))
+            else:
+                converted.put((path, workdir, outdir, 1, outbytes, stats))
+            return True
+            
+        def finished():
+            """ The results of the uploads that completed meanwhile. """
+            results = []
+            while True:
+                try:
+                    result = done.get_nowait()
+                except Queue.Empty:
+                    return results
+                if result is None:
+                    # the uploader stopped early, the end is seen below
+                    done.put(None)
+                    return results
+                results.append(result)
+                    
+        fetcher = threading.Thread(target=fetch_all)
+        uploader = threading.Thread(target=upload_all)
+        fetcher.daemon = uploader.daemon = True
+        fetcher.start()
+        uploader.start()
+        more = True
+        while more and not failed:
+            for result in finished():
+                yield result
+            try:
+                more = convert_next()
+            except:
+                failed.append(sys.exc_info())
+                budget.abort()
+        # let the fetcher finish and wait for the uploads
+        while more:
+            more = fetched.get() is not None
+        converted.put(None)
+        while True:
+            result = done.get()
+            if result is None:
+                break
+            yield result
+        fetcher.join()
+        uploader.join()
+        if failed:
+            raise failed[0][0], failed[0][1], failed[0][2]
         
     def reducer(self, key, values):
         yield key, sum(values)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+netcdf3.py
+==========
+
+A read only netCDF-3 reader that memory maps the file.
+
+Exodus II files are netCDF-3 files in the classic or the 64-bit offset
+format.  NetCDFFile parses the header and exposes every variable as a
+numpy view on one read only np.memmap of the file, so nothing is read
+until it is used.  A record variable, such as time_whole or
+vals_nod_var1, is a strided view whose first axis steps over the
+records, and reading one time step of it touches only the pages of that
+record.
+
+The interface is the subset of Scientific.IO.NetCDF that ExoFile uses:
+dimensions, variables, getValue(), slicing and the attributes.
+
+NetCDFWriter writes files in the same formats without a netCDF library,
+one variable or one record at a time, so a file need not fit in memory.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+# the nc_type codes and their (big endian) numpy types
+TYPES = {
+    1: np.dtype('>i1'),
+    2: np.dtype('S1'),
+    3: np.dtype('>i2'),
+    4: np.dtype('>i4'),
+    5: np.dtype('>f4'),
+    6: np.dtype('>f8'),
+}
+TYPECODES = {1: 'b', 2: 'c', 3: 's', 4: 'i', 5: 'f', 6: 'd'}
+NC_TYPES = dict([(typecode, nc_type) for nc_type, typecode in TYPECODES.items()])
+
+STREAMING = 0xFFFFFFFF
+
+class FormatError(IOError):
+    """ The file is not a netCDF-3 file. """
+    pass
+
+def _padded(n):
+    """ n rounded up to a multiple of 4 bytes. """
+    return (n + 3) & ~3
+
+class _Header(object):
+    """ Reads the header fields from the start of a file. """
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise FormatError('%s: the header is truncated'%(self.f.name))
+        return data
+
+    def int(self):
+        return struct.unpack('>i', self.read(4))[0]
+
+    def uint(self):
+        return struct.unpack('>I', self.read(4))[0]
+
+    def offset(self, size):
+        if size == 8:
+            return struct.unpack('>q', self.read(8))[0]
+        return struct.unpack('>i', self.read(4))[0]
+
+    def name(self):
+        n = self.int()
+        return self.read(_padded(n))[:n]
+
+    def values(self, nc_type, n):
+        if nc_type not in TYPES:
+            raise FormatError('%s: unknown nc_type %i'%(self.f.name, nc_type))
+        dtype = TYPES[nc_type]
+        data = self.read(_padded(n*dtype.itemsize))[:n*dtype.itemsize]
+        if nc_type == 2:
+            return data.rstrip('\x00')
+        # the attributes are small, they are copied to native arrays
+        return np.frombuffer(data, dtype=dtype).astype(dtype.newbyteorder('='))
+
+    def list(self, tag):
+        """ The number of elements of a list with the tag, 0 if absent. """
+        found, n = self.int(), self.int()
+        if found == 0 and n == 0:
+            return 0
+        if found != tag:
+            raise FormatError('%s: expected the tag %i, not %i'%(self.f.name, tag, found))
+        return n
+
+    def attributes(self):
+        attrs = {}
+        for i in xrange(self.list(NC_ATTRIBUTE)):
+            name = self.name()
+            nc_type = self.int()
+            attrs[name] = self.values(nc_type, self.int())
+        return attrs
+
+class NetCDFVariable(object):
+    """ A variable of a NetCDFFile, a view on the memory map. """
+    def __init__(self, name, data, dimensions, nc_type, attributes):
+        self.name = name
+        self.dimensions = dimensions
+        self._data = data
+        self._nc_type = nc_type
+        self.__dict__.update(attributes)
+
+    @property
+    def shape(self):
+        return self._data.shape
+
+    def typecode(self):
+        return TYPECODES[self._nc_type]
+
+    def getValue(self):
+        """ The values, a read only view and not a copy. """
+        if len(self.dimensions) == 0:
+            return self._data[()]
+        return self._data
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __len__(self):
+        return len(self._data)
+
+class NetCDFFile(object):
+    """ A memory mapped netCDF-3 file, read only. """
+    def __init__(self, filename, mode='r'):
+        """
+        @param filename the name of the netCDF file
+        @param mode only 'r' is supported
+        """
+        if mode != 'r':
+            raise ValueError('netcdf3 files are read only, not %s'%(mode))
+        self.filename = filename
+        f = open(filename, 'rb')
+        try:
+            self._read(f)
+        finally:
+            f.close()
+
+    def _read(self, f):
+        h = _Header(f)
+        magic = h.read(4)
+        if magic[:3] != 'CDF' or magic[3] not in '\x01\x02':
+            raise FormatError('%s is not a netCDF-3 file'%(self.filename))
+        offsetsize = 4
+        if magic[3] == '\x02':
+            offsetsize = 8
+        numrecs = h.uint()
+
+        dimnames = []
+        dimlengths = []
+        dimensions = {}
+        for i in xrange(h.list(NC_DIMENSION)):
+            name = h.name()
+            length = h.int()
+            dimnames.append(name)
+            dimlengths.append(length)
+            # the record dimension has no fixed length
+            dimensions[name] = length or None
+
+        # the global attributes are attributes of the file
+        self.__dict__.update(h.attributes())
+        self.dimensions = dimensions
+
+        specs = []
+        for i in xrange(h.list(NC_VARIABLE)):
+            name = h.name()
+            dimids = [h.int() for j in xrange(h.int())]
+            attrs = h.attributes()
+            nc_type = h.int()
+            vsize = h.uint()
+            begin = h.offset(offsetsize)
+            if nc_type not in TYPES:
+                raise FormatError('%s: unknown nc_type %i'%(self.filename, nc_type))
+            isrec = len(dimids) > 0 and dimlengths[dimids[0]] == 0
+            specs.append((name, dimids, attrs, nc_type, vsize, begin, isrec))
+
+        # the records interleave the record variables, padded to 4 bytes
+        # unless there is only one record variable
+        recvars = [spec for spec in specs if spec[6]]
+        recsize = 0
+        for name, dimids, attrs, nc_type, vsize, begin, isrec in recvars:
+            if len(recvars) == 1:
+                n = TYPES[nc_type].itemsize
+                for d in dimids[1:]:
+                    n *= dimlengths[d]
+                recsize = n
+            else:
+                recsize += vsize
+
+        filesize = os.path.getsize(self.filename)
+        if numrecs == STREAMING:
+            # the number of records was not written, count the records
+            numrecs = 0
+            if recvars and recsize > 0:
+                numrecs = (filesize - min([spec[5] for spec in recvars]))//recsize
+        self.numrecs = numrecs
+
+        mm = None
+        if filesize > 0:
+            mm = np.memmap(self.filename, dtype=np.uint8, mode='r')
+
+        self.variables = {}
+        for name, dimids, attrs, nc_type, vsize, begin, isrec in specs:
+            dtype = TYPES[nc_type]
+            shape = [dimlengths[d] for d in dimids]
+            if isrec:
+                shape[0] = numrecs
+            strides = []
+            stride = dtype.itemsize
+            for n in reversed(shape):
+                strides.insert(0, stride)
+                stride *= n
+            if isrec:
+                strides[0] = recsize
+            if 0 in shape or mm is None:
+                data = np.zeros(shape, dtype=dtype)
+            else:
+                end = begin + sum([(n-1)*s for n, s in zip(shape, strides)]) + dtype.itemsize
+                if end > filesize:
+                    raise FormatError('%s: the variable %s is truncated'%(self.filename, name))
+                data = np.ndarray(tuple(shape), dtype=dtype, buffer=mm,
+                    offset=begin, strides=tuple(strides))
+            self.variables[name] = NetCDFVariable(name, data,
+                tuple([dimnames[d] for d in dimids]), nc_type, attrs)
+
+    def close(self):
+        """ Drop the views on the memory map. """
+        self.variables = {}
+
+def _pack_name(name):
+    return struct.pack('>i', len(name)) + name + '\x00'*(_padded(len(name)) - len(name))
+
+def _attribute_values(value):
+    """ The nc_type and the values of an attribute value. """
+    if isinstance(value, str):
+        return 2, np.frombuffer(value, dtype='S1')
+    value = np.asarray(value).reshape(-1)
+    for nc_type, dtype in TYPES.items():
+        if nc_type != 2 and value.dtype.kind == dtype.kind and value.dtype.itemsize == dtype.itemsize:
+            return nc_type, value.astype(dtype)
+    raise ValueError('no netCDF-3 type for the attribute type %s'%(value.dtype))
+
+def _pack_attributes(attrs):
+    if not attrs:
+        return struct.pack('>ii', 0, 0)
+    data = [struct.pack('>ii', NC_ATTRIBUTE, len(attrs))]
+    for name, value in attrs:
+        nc_type, values = _attribute_values(value)
+        raw = values.tostring()
+        data.append(_pack_name(name) + struct.pack('>ii', nc_type, len(values)) +
+            raw + '\x00'*(_padded(len(raw)) - len(raw)))
+    return ''.join(data)
+
+class NetCDFWriter(object):
+    """ Writes a netCDF-3 file.
+    
+    The dimensions, variables and attributes are defined first, begin()
+    writes the header, and put() writes the values of a variable, or of
+    one record of a record variable, straight to their place in the file.
+    
+        w = NetCDFWriter('out.nc')
+        w.create_dimension('time_step', None)
+        w.create_dimension('num_nodes', 100)
+        w.create_variable('vals', 'd', ('time_step', 'num_nodes'))
+        w.begin()
+        for j in xrange(10):
+            w.put('vals', values[j], record=j)
+        w.close()
+    
+    The file is in the classic format, or in the 64-bit offset format when
+    a variable starts beyond 2 GiB.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.numrecs = 0
+        self._dims = []
+        self._attrs = []
+        self._vars = []
+        self._layout = None
+        self._f = None
+        
+    def create_dimension(self, name, length):
+        """
+        @param length the length, None for the record dimension
+        """
+        if length is None:
+            length = 0
+        self._dims.append((name, length))
+        
+    def set_attribute(self, name, value):
+        """ Set a global attribute, a str or a numpy array. """
+        self._attrs.append((name, value))
+        
+    def create_variable(self, name, typecode, dimensions, attributes=None):
+        """
+        @param typecode one of 'b', 'c', 's', 'i', 'f' and 'd'
+        @param dimensions the names of the dimensions, the record
+            dimension first
+        @param attributes a list of (name, value) tuples
+        """
+        dimnames = [dim[0] for dim in self._dims]
+        dimids = [dimnames.index(dim) for dim in dimensions]
+        self._vars.append((name, NC_TYPES[typecode], dimids, attributes or []))
+        
+    def _isrec(self, dimids):
+        return len(dimids) > 0 and self._dims[dimids[0]][1] == 0
+        
+    def _header(self, offsetsize, begins):
+        data = ['CDF' + {4: '\x01', 8: '\x02'}[offsetsize], struct.pack('>I', 0)]
+        data.append(struct.pack('>ii', NC_DIMENSION, len(self._dims)))
+        for name, length in self._dims:
+            data.append(_pack_name(name) + struct.pack('>i', length))
+        data.append(_pack_attributes(self._attrs))
+        data.append(struct.pack('>ii', NC_VARIABLE, len(self._vars)))
+        for (name, nc_type, dimids, attrs), vsize, begin in zip(self._vars,
+                self._vsizes(), begins):
+            data.append(_pack_name(name) + struct.pack('>i', len(dimids)) +
+                ''.join([struct.pack('>i', d) for d in dimids]) +
+                _pack_attributes(attrs) + struct.pack('>iI', nc_type, vsize) +
+                struct.pack({4: '>i', 8: '>q'}[offsetsize], begin))
+        return ''.join(data)
+        
+    def _vsizes(self):
+        vsizes = []
+        for name, nc_type, dimids, attrs in self._vars:
+            n = TYPES[nc_type].itemsize
+            for d in dimids:
+                if self._dims[d][1] > 0:
+                    n *= self._dims[d][1]
+            vsizes.append(_padded(n))
+        return vsizes
+        
+    def begin(self):
+        """ Lay out the variables and write the header. """
+        vsizes = self._vsizes()
+        recvars = [self._isrec(var[2]) for var in self._vars]
+        for offsetsize in (4, 8):
+            begin = len(self._header(offsetsize, [0]*len(self._vars)))
+            begins = [0]*len(self._vars)
+            for i, vsize in enumerate(vsizes):
+                if not recvars[i]:
+                    begins[i] = begin
+                    begin += vsize
+            recsize = 0
+            for i, vsize in enumerate(vsizes):
+                if recvars[i]:
+                    begins[i] = begin + recsize
+                    recsize += vsize
+            if max(begins + [0]) < 2**31:
+                break
+        if recvars.count(True) == 1:
+            # a single record variable is not padded
+            i = recvars.index(True)
+            n = TYPES[self._vars[i][1]].itemsize
+            for d in self._vars[i][2][1:]:
+                n *= self._dims[d][1]
+            recsize = n
+        self._layout = dict([(var[0], (var[1], var[2], b))
+            for var, b in zip(self._vars, begins)])
+        self._recbegin = begin
+        self._recsize = recsize
+        self._end = begin
+        self._f = open(self.filename, 'wb')
+        self._f.write(self._header(offsetsize, begins))
+        
+    def put(self, name, data, record=None):
+        """ Write the values of a variable.
+        
+        @param data the values, of the shape of the variable, or of one
+            record of it
+        @param record the record to write, for a record variable
+        """
+        nc_type, dimids, begin = self._layout[name]
+        shape = [self._dims[d][1] for d in dimids]
+        offset = begin
+        if self._isrec(dimids):
+            if record is None:
+                raise ValueError('%s is a record variable, put needs the record'%(name))
+            shape = shape[1:]
+            offset += record*self._recsize
+            self.numrecs = max(self.numrecs, record + 1)
+        data = np.asarray(data, dtype=TYPES[nc_type])
+        if data.size != int(np.prod(shape)):
+            raise ValueError('%s needs %i values, not %i'%(name, int(np.prod(shape)), data.size))
+        self._f.seek(offset)
+        self._f.write(data.tostring())
+        self._end = max(self._end, self._f.tell())
+        
+    def close(self):
+        """ Write the number of records and close the file. """
+        if self._f is None:
+            return
+        end = max(self._end, self._recbegin + self.numrecs*self._recsize)
+        self._f.seek(0, 2)
+        if self._f.tell() < end:
+            self._f.truncate(end)
+        self._f.seek(4)
+        self._f.write(struct.pack('>I', self.numrecs))
+        self._f.close()
+        self._f = None
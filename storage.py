@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""
+storage.py
+==========
+
+Access to the file system that holds the exodus files and the converted
+datasets.
+
+``HadoopShellStorage`` runs ``hadoop fs``, but batches the commands so
+that a whole output directory is uploaded with a couple of JVM starts
+instead of three per file.  ``WebHDFSStorage`` is an in-process WebHDFS
+REST client over persistent HTTP connections and does not start a JVM at
+all.  ``LocalStorage`` works on the local file system, as a stand-in for
+the cluster when testing.
+
+All of them take paths as hdfs:// (or webhdfs://) URLs or as absolute
+paths.
+"""
+
+import os
+import json
+import shutil
+import urllib
+import httplib
+import urlparse
+import posixpath
+import threading
+from subprocess import call, check_call, Popen, PIPE
+
+import exodus2seq as ex
+
+STORAGES = ('shell', 'webhdfs', 'local')
+
+class StorageError(IOError):
+    pass
+
+def _path(path):
+    """ The path part of an hdfs:// URL. """
+    return urlparse.urlparse(path).path or '/'
+
+class HadoopShellStorage(object):
+    """ The hadoop fs command line, with batched commands. """
+    def __init__(self, hadoop='hadoop'):
+        self.hadoop = hadoop
+
+    def _fs(self, *args):
+        return [self.hadoop, 'fs'] + list(args)
+
+    def _output(self, args):
+        devnull = open(os.devnull, 'w')
+        try:
+            p = Popen(self._fs(*args), stdout=PIPE, stderr=devnull)
+            out = p.communicate()[0]
+        finally:
+            devnull.close()
+        return p.returncode, out
+
+    def cat(self, path):
+        """ The contents of a file, or None if it does not exist. """
+        returncode, out = self._output(['-cat', path])
+        if returncode != 0:
+            return None
+        return out
+
+    def status(self, path):
+        """ The size and the modification time in milliseconds of a
+        file, as a dict with the keys bytes and mtime, or None if it does
+        not exist. """
+        returncode, out = self._output(['-stat', '%b %Y', path])
+        fields = out.split()
+        if returncode != 0 or len(fields) != 2:
+            return None
+        return {'bytes': int(fields[0]), 'mtime': int(fields[1])}
+
+    def sizes(self, dirname):
+        """ The sizes of the files in a directory, None if it does not exist. """
+        returncode, out = self._output(['-ls', dirname])
+        if returncode != 0:
+            return None
+        sizes = {}
+        for l in out.splitlines():
+            # permissions replication owner group size date time path
+            fields = l.split()
+            if len(fields) >= 8 and fields[0].startswith('-'):
+                sizes[posixpath.basename(fields[-1])] = int(fields[4])
+        return sizes
+
+    def get(self, path, localpath):
+        """ Copy a file to the local file system. """
+        check_call(self._fs('-copyToLocal', path, localpath))
+
+    def put_dir(self, localdir, dirname, fnames=None):
+        """ Copy the files of a local directory into a directory.
+
+        Existing files are removed before the first one is copied.  The
+        files are copied in the order of fnames, all of them by a single
+        hadoop fs command.
+
+        @param fnames the files to copy, all files of localdir by default
+        """
+        if fnames is None:
+            fnames = sorted(os.listdir(localdir))
+        if len(fnames) == 0:
+            return
+        sizes = self.sizes(dirname)
+        if sizes is None:
+            check_call(self._fs('-mkdir', dirname))
+            sizes = {}
+        existing = [posixpath.join(dirname, fname) for fname in fnames if fname in sizes]
+        if len(existing) > 0:
+            check_call(self._fs('-rm', *existing))
+        paths = [os.path.join(localdir, fname) for fname in fnames]
+        check_call(self._fs(*(['-copyFromLocal'] + paths + [dirname])))
+
+    def delete(self, path):
+        """ Remove a file or a directory with its contents. """
+        call(self._fs('-rmr', path))
+
+class WebHDFSStorage(object):
+    """ An in-process WebHDFS client.
+
+    The connections to the namenode and to the datanodes are kept open
+    and reused for all requests, so uploading the files of a directory
+    costs a couple of HTTP requests per file.  Every thread has
+    connections of its own.
+    """
+    def __init__(self, url, user=None, timeout=600):
+        """
+        @param url the WebHDFS address of the namenode, e.g.
+            http://namenode:50070
+        @param user the user name to act as, $USER by default
+        """
+        parts = urlparse.urlparse(url)
+        self.scheme = parts.scheme or 'http'
+        self.netloc = parts.netloc or parts.path
+        self.user = user or os.environ.get('USER')
+        self.timeout = timeout
+        self._threadlocal = threading.local()
+        
+    @property
+    def _conns(self):
+        if not hasattr(self._threadlocal, 'conns'):
+            self._threadlocal.conns = {}
+        return self._threadlocal.conns
+
+    def _conn(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self._conns:
+            if scheme == 'https':
+                self._conns[key] = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                self._conns[key] = httplib.HTTPConnection(netloc, timeout=self.timeout)
+        return self._conns[key]
+
+    def _request(self, method, scheme, netloc, url, body=None):
+        """ Send a request on a kept open connection, retry once if the
+        server closed it meanwhile. """
+        for attempt in (0, 1):
+            conn = self._conn(scheme, netloc)
+            try:
+                conn.request(method, url, body)
+                return conn.getresponse()
+            except (httplib.HTTPException, IOError):
+                conn.close()
+                del self._conns[(scheme, netloc)]
+                if attempt == 1 or body is not None and hasattr(body, 'read'):
+                    raise
+
+    def _url(self, path, op, **params):
+        params['op'] = op
+        if self.user:
+            params['user.name'] = self.user
+        return '/webhdfs/v1%s?%s'%(urllib.quote(_path(path)), urllib.urlencode(params))
+
+    def _namenode(self, method, path, op, **params):
+        return self._request(method, self.scheme, self.netloc,
+            self._url(path, op, **params))
+
+    def _redirected(self, method, response, body=None):
+        """ Follow the redirect of the namenode to a datanode. """
+        location = response.getheader('location')
+        response.read()
+        if response.status != 307 or location is None:
+            raise StorageError('WebHDFS %s failed with status %i'%(method, response.status))
+        parts = urlparse.urlparse(location)
+        url = parts.path
+        if parts.query:
+            url += '?' + parts.query
+        return self._request(method, parts.scheme, parts.netloc, url, body)
+
+    def _check(self, response, *ok):
+        if response.status not in ok:
+            message = response.read()
+            raise StorageError('WebHDFS request failed with status %i: %s'%(
+                response.status, message[:200]))
+
+    def _open(self, path):
+        response = self._namenode('GET', path, 'OPEN')
+        if response.status == 404:
+            response.read()
+            return None
+        response = self._redirected('GET', response)
+        self._check(response, 200)
+        return response
+
+    def cat(self, path):
+        """ The contents of a file, or None if it does not exist. """
+        response = self._open(path)
+        if response is None:
+            return None
+        return response.read()
+
+    def status(self, path):
+        """ The size and the modification time in milliseconds of a
+        file, as a dict with the keys bytes and mtime, or None if it does
+        not exist. """
+        response = self._namenode('GET', path, 'GETFILESTATUS')
+        if response.status == 404:
+            response.read()
+            return None
+        self._check(response, 200)
+        status = json.loads(response.read())['FileStatus']
+        return {'bytes': status['length'], 'mtime': status['modificationTime']}
+
+    def sizes(self, dirname):
+        """ The sizes of the files in a directory, None if it does not exist. """
+        response = self._namenode('GET', dirname, 'LISTSTATUS')
+        if response.status == 404:
+            response.read()
+            return None
+        self._check(response, 200)
+        statuses = json.loads(response.read())['FileStatuses']['FileStatus']
+        sizes = {}
+        for status in statuses:
+            if status['type'] == 'FILE':
+                sizes[str(status['pathSuffix'])] = status['length']
+        return sizes
+
+    def get(self, path, localpath):
+        """ Copy a file to the local file system. """
+        response = self._open(path)
+        if response is None:
+            raise StorageError('%s does not exist'%(path))
+        f = open(localpath, 'wb')
+        try:
+            for chunk in iter(lambda: response.read(1<<20), ''):
+                f.write(chunk)
+        finally:
+            f.close()
+
+    def put(self, localpath, path):
+        """ Copy a local file, overwriting an existing file. """
+        response = self._namenode('PUT', path, 'CREATE', overwrite='true')
+        f = open(localpath, 'rb')
+        try:
+            response = self._redirected('PUT', response, f)
+        finally:
+            f.close()
+        self._check(response, 200, 201)
+        response.read()
+
+    def put_dir(self, localdir, dirname, fnames=None):
+        """ Copy the files of a local directory into a directory.
+
+        Existing files are removed before the first one is copied, the
+        files are copied in the order of fnames over the kept open
+        connections.
+
+        @param fnames the files to copy, all files of localdir by default
+        """
+        if fnames is None:
+            fnames = sorted(os.listdir(localdir))
+        sizes = self.sizes(dirname) or {}
+        for fname in fnames:
+            if fname in sizes:
+                self.delete(posixpath.join(dirname, fname))
+        for fname in fnames:
+            self.put(os.path.join(localdir, fname), posixpath.join(dirname, fname))
+
+    def delete(self, path):
+        """ Remove a file or a directory with its contents. """
+        response = self._namenode('DELETE', path, 'DELETE', recursive='true')
+        self._check(response, 200)
+        response.read()
+
+class LocalStorage(object):
+    """ The local file system as a stand-in for the cluster.
+
+    The path of an hdfs:// URL is taken relative to root.
+    """
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, _path(path).lstrip('/'))
+
+    def cat(self, path):
+        """ The contents of a file, or None if it does not exist. """
+        if not os.path.isfile(self._local(path)):
+            return None
+        f = open(self._local(path), 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def status(self, path):
+        """ The size and the modification time in milliseconds of a
+        file, as a dict with the keys bytes and mtime, or None if it does
+        not exist. """
+        if not os.path.isfile(self._local(path)):
+            return None
+        st = os.stat(self._local(path))
+        return {'bytes': st.st_size, 'mtime': int(st.st_mtime*1000)}
+
+    def sizes(self, dirname):
+        """ The sizes of the files in a directory, None if it does not exist. """
+        if not os.path.isdir(self._local(dirname)):
+            return None
+        return ex.local_sizes(self._local(dirname))
+
+    def get(self, path, localpath):
+        """ Copy a file to the local file system. """
+        shutil.copyfile(self._local(path), localpath)
+
+    def put_dir(self, localdir, dirname, fnames=None):
+        """ Copy the files of a local directory into a directory.
+
+        Existing files are removed before the first one is copied, the
+        files are copied in the order of fnames.
+
+        @param fnames the files to copy, all files of localdir by default
+        """
+        if fnames is None:
+            fnames = sorted(os.listdir(localdir))
+        if not os.path.isdir(self._local(dirname)):
+            os.makedirs(self._local(dirname))
+        for fname in fnames:
+            if os.path.exists(os.path.join(self._local(dirname), fname)):
+                os.remove(os.path.join(self._local(dirname), fname))
+        for fname in fnames:
+            shutil.copyfile(os.path.join(localdir, fname),
+                os.path.join(self._local(dirname), fname))
+
+    def delete(self, path):
+        """ Remove a file or a directory with its contents. """
+        if os.path.isdir(self._local(path)):
+            shutil.rmtree(self._local(path))
+        elif os.path.exists(self._local(path)):
+            os.remove(self._local(path))
+
+def open_storage(kind='shell', url=None, user=None):
+    """ Create the storage of a kind in STORAGES.
+
+    @param url the WebHDFS address of the namenode for 'webhdfs', the
+        root directory for 'local'
+    @param user the WebHDFS user name
+    """
+    if kind == 'shell':
+        return HadoopShellStorage()
+    elif kind == 'webhdfs':
+        if url is None:
+            raise ValueError('webhdfs storage needs the namenode address')
+        return WebHDFSStorage(url, user)
+    elif kind == 'local':
+        return LocalStorage(url or '/')
+    raise ValueError('unknown storage %s'%(kind))
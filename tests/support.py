@@ -0,0 +1,56 @@
+"""
+Shared fixtures of the tests.
+
+Run the tests from the top directory with
+
+python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import exopy2 as ep
+
+class TempDirTestCase(unittest.TestCase):
+    """ A test case with a temporary directory, self.tmpdir. """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='exodus2seq_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def synthetic(self, num_nodes=60, num_time_steps=12, num_vars=2,
+            word_size=8, name='syn.e'):
+        """ Write a synthetic exodus file into tmpdir.
+
+        @return the path of the file and the names of its node variables
+        """
+        path = os.path.join(self.tmpdir, name)
+        names = ep.write_synthetic(path, num_nodes, num_time_steps, num_vars,
+            word_size)
+        return path, names
+
+def node_values(path, names):
+    """ The (time steps x nodes) arrays of the node variables of an
+    exodus file, by name. """
+    f = ep.ExoFile(path)
+    return dict([(name, np.array(f.node_variable(name)[:])) for name in names])
+
+def set_last_value(path, value):
+    """ Overwrite the last node value of the last time step of a
+    synthetic exodus file in place, and move its modification time. """
+    f = open(path, 'r+b')
+    try:
+        f.seek(-8, 2)
+        f.write(np.array([value], dtype='>f8').tostring())
+    finally:
+        f.close()
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
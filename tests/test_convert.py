@@ -0,0 +1,213 @@
+import os
+
+import numpy as np
+
+from support import TempDirTestCase, node_values, set_last_value
+import exodus2seq as ex
+import exodus2seq_convert as ec
+from exodus2seq_reader import Dataset
+
+class ConvertTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.path, self.names = self.synthetic(num_nodes=60, num_time_steps=12)
+        self.values = node_values(self.path, self.names)
+        self.times = np.linspace(0., 1., 12)
+        self.outdir = os.path.join(self.tmpdir, 'out')
+        os.mkdir(self.outdir)
+
+    def convert(self, steps=5, **kwargs):
+        """ Convert the synthetic file, return the Dataset and the Stats. """
+        stats = ec.Stats()
+        self.assertTrue(ec.convert(self.path, steps, self.outdir,
+            ','.join(self.names), subdir=True, stats=stats, **kwargs))
+        return Dataset(os.path.join(self.outdir, 'syn')), stats
+
+    def blocks(self, ds):
+        """ The values of iter_blocks() joined over all blocks. """
+        steps = []
+        values = {}
+        for block in ds.iter_blocks():
+            if ds.layout == 'node-major':
+                steps = block.steps.tolist()
+                for name, data in block.values:
+                    values.setdefault(name, []).append(data)
+            else:
+                steps.extend(block.steps.tolist())
+                for name, data in block.values:
+                    values.setdefault(name, []).append(data)
+        axis = 1 if ds.layout == 'node-major' else 0
+        return steps, dict([(name, np.concatenate(arrays, axis=axis))
+            for name, arrays in values.items()])
+
+    def check(self, ds, atol=0., steps=None):
+        if steps is None:
+            steps = range(12)
+        got, values = self.blocks(ds)
+        self.assertEqual(got, steps)
+        for name in self.names:
+            expect = self.values[name][steps]
+            if atol == 0.:
+                self.assertTrue(np.array_equal(values[name], expect), name)
+            else:
+                self.assertTrue(np.abs(values[name] - expect).max() <= atol, name)
+        for step in steps:
+            time, stepvalues = ds.get_step(step)
+            self.assertAlmostEqual(time, self.times[step])
+            stepvalues = dict(stepvalues)
+            for name in self.names:
+                self.assertTrue(np.allclose(stepvalues[name], self.values[name][step],
+                    rtol=0, atol=atol), (name, step))
+
+    def test_plain(self):
+        ds, stats = self.convert()
+        self.check(ds)
+        self.assertEqual(stats.counts['parts'], 3)
+        self.assertEqual(stats.counts['steps'], 12)
+        self.assertEqual(sorted(ds.info), ['total'])
+
+    def test_packed(self):
+        ds, stats = self.convert(encoding='packed')
+        self.check(ds)
+        self.assertEqual(ds.info['encoding'], 'packed')
+        self.assertTrue(ds.parts[0].offsets)
+
+    def test_delta(self):
+        for shuffle in (False, True):
+            ds, stats = self.convert(encoding='packed', delta=True, shuffle=shuffle)
+            self.assertTrue(ds.delta)
+            self.check(ds)
+            selected = list(ds.get_time_range(0.3, 0.6))
+            self.assertEqual([step for step, time, values in selected], [4, 5, 6])
+
+    def test_quantize(self):
+        ds, stats = self.convert(encoding='packed', quantize=1e-3, delta=True)
+        self.assertEqual(ds.precision, {'quantize': 1e-3, 'scale': 2e-3})
+        self.check(ds, atol=1e-3*(1 + 1e-9))
+
+    def test_float32(self):
+        ds, stats = self.convert(encoding='packed', dtype='float32')
+        got, values = self.blocks(ds)
+        for name in self.names:
+            self.assertEqual(values[name].dtype, np.float32)
+            self.assertTrue(np.array_equal(values[name],
+                self.values[name].astype(np.float32)))
+
+    def test_part_bytes_quantize(self):
+        # the values are within 1.1, the codes of a tolerance of 1e-10
+        # need int64 and those of 1e-3 int32
+        for tolerance, num_parts in ((1e-10, 4), (1e-3, 2)):
+            ds, stats = self.convert(None, encoding='packed', quantize=tolerance,
+                part_bytes=60*2*8*3)
+            self.assertEqual(len(ds.parts), num_parts)
+            self.check(ds, atol=tolerance*(1 + 1e-6))
+
+    def test_node_block(self):
+        ds, stats = self.convert(encoding='packed', node_block=25)
+        self.assertEqual(len(ds.parts), 9)
+        self.check(ds)
+
+    def test_node_major(self):
+        ds, stats = self.convert(encoding='packed', layout='node-major',
+            node_block=25, stride=2)
+        self.assertEqual(ds.layout, 'node-major')
+        got, values = self.blocks(ds)
+        self.assertEqual(got, range(0, 12, 2))
+        for name in self.names:
+            self.assertTrue(np.array_equal(values[name], self.values[name][::2]))
+        for step in (0, 6, 10):
+            self.assertTrue(np.array_equal(dict(ds.get_step(step)[1])[self.names[0]],
+                self.values[self.names[0]][step]))
+
+    def test_node_major_part_bytes(self):
+        # the slabs of the transpose hold every node of a variable
+        slabs = []
+        transpose = ex.transpose_node_blocks
+        def record(vardata, num_time_steps, steps, nodeblocks, tmpdir=None, **kwargs):
+            slabs.append((steps, tmpdir))
+            return transpose(vardata, num_time_steps, steps, nodeblocks, tmpdir,
+                **kwargs)
+        ex.transpose_node_blocks = record
+        try:
+            ds, stats = self.convert(None, encoding='packed', layout='node-major',
+                node_block=10, part_bytes=1000)
+        finally:
+            ex.transpose_node_blocks = transpose
+        self.assertEqual(slabs, [(2, os.path.join(self.outdir, 'syn'))])
+        self.assertTrue(slabs[0][0]*60*8 <= 1000)
+        self.assertEqual(len(ds.parts), 6)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.outdir, 'syn'))),
+            sorted(ex.read_manifest(os.path.join(self.outdir, 'syn'))['files'].keys() +
+            [ex.MANIFEST_FILE]))
+        got, values = self.blocks(ds)
+        for name in self.names:
+            self.assertTrue(np.array_equal(values[name], self.values[name]))
+
+    def test_node_major_rejects_element_variables(self):
+        self.assertFalse(ec.convert(self.path, 5, self.outdir, 'VAR0',
+            layout='node-major', node_block=25, elem_variables='STRESS'))
+
+    def test_time_range(self):
+        ds, stats = self.convert(2, encoding='packed', time_range=(2, 11), stride=3)
+        self.check(ds, steps=[2, 5, 8])
+        self.assertRaises(KeyError, ds.get_step, 3)
+
+    def test_workers(self):
+        ds, stats = self.convert(encoding='packed', workers=2)
+        self.check(ds)
+
+    def test_resume(self):
+        self.convert(encoding='packed')
+        ds, stats = self.convert(encoding='packed')
+        self.assertEqual(stats.counts['parts_kept'], 3)
+        self.check(ds)
+
+        # a part of the same size with other bytes is written again
+        part = os.path.join(self.outdir, 'syn', 'syn_part1.seq')
+        f = open(part, 'r+b')
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(chr(ord(last) ^ 1))
+        f.close()
+        ds, stats = self.convert(encoding='packed')
+        self.assertEqual(stats.counts['parts_kept'], 2)
+        self.check(ds)
+
+    def test_changed_exodus_file(self):
+        self.convert(encoding='packed')
+        set_last_value(self.path, 42.)
+        ds, stats = self.convert(encoding='packed')
+        self.assertEqual(stats.counts['parts_kept'], 0)
+        self.assertEqual(dict(ds.get_step(11)[1])[self.names[-1]][-1], 42.)
+
+    def test_quantize_non_finite(self):
+        set_last_value(self.path, np.nan)
+        self.assertFalse(ec.convert(self.path, 5, self.outdir, ','.join(self.names),
+            encoding='packed', quantize=1e-3, subdir=True))
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, 'syn', 'index.seq')))
+        ds, stats = self.convert(encoding='packed')
+        self.assertTrue(np.isnan(dict(ds.get_step(11)[1])[self.names[-1]][-1]))
+
+    def test_manifest(self):
+        self.convert(encoding='packed')
+        dsdir = os.path.join(self.outdir, 'syn')
+        manifest = ex.read_manifest(dsdir)
+        self.assertEqual(manifest['config']['source'], ex.source_info(self.path))
+        self.assertEqual(sorted(manifest['files']), ['_offsets.seq', 'index.seq',
+            'syn_part0.seq', 'syn_part1.seq', 'syn_part2.seq'])
+        self.assertEqual(sorted(os.listdir(dsdir)), ['_manifest.json',
+            '_offsets.seq', 'index.seq', 'syn_part0.seq', 'syn_part1.seq',
+            'syn_part2.seq'])
+
+class RunLocalTest(TempDirTestCase):
+    def test_run_local(self):
+        paths = [self.synthetic(name='a.e')[0], self.synthetic(name='b.e')[0]]
+        outdir = os.path.join(self.tmpdir, 'out')
+        os.mkdir(outdir)
+        results = ec.run_local(paths + paths[:1], 5, outdir, 'VAR0', processes=2,
+            encoding='packed')
+        self.assertEqual(results, [(paths[0], 0), (paths[1], 0)])
+        for name in ('a', 'b'):
+            self.assertTrue(os.path.isfile(os.path.join(outdir, name, 'index.seq')))
+            self.assertTrue(os.path.isfile(os.path.join(outdir, name + ec.REPORT_SUFFIX)))
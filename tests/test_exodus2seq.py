@@ -0,0 +1,149 @@
+import os
+
+import numpy as np
+
+from support import TempDirTestCase
+import exopy2 as ep
+import exodus2seq as ex
+
+def same_bits(a, b):
+    return a.dtype == b.dtype and a.shape == b.shape and a.tostring() == b.tostring()
+
+class PackTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        rng = np.random.RandomState(1)
+        self.steps = [np.cumsum(rng.rand(5, 40), axis=0).astype(dtype)
+            for dtype in ('>f8', '<f8', '>f4', '<f4')]
+
+    def test_packed(self):
+        for data in self.steps:
+            packed = ex.pack_array(data)
+            self.assertEqual(len(packed), 3)
+            self.assertTrue(same_bits(ex.unpack_array(packed), data))
+
+    def test_plain(self):
+        data = self.steps[0][0]
+        value = ex.encode_array(data, 'plain')
+        self.assertTrue(isinstance(value[0], float))
+        self.assertTrue(np.array_equal(ex.decode_array(value), data))
+
+    def test_delta_and_shuffle_are_exact(self):
+        for data in self.steps:
+            data = data.copy()
+            # values whose bit patterns a float difference would lose
+            data[1,0] = np.nan
+            data[2,1] = -0.0
+            data[3,2] = np.inf
+            data[4,3] = np.finfo(data.dtype).tiny
+            for shuffle in (False, True):
+                previous = None
+                for step in data:
+                    packed = ex.pack_array(step, previous, shuffle)
+                    decoded = ex.unpack_array(packed, previous)
+                    self.assertTrue(same_bits(decoded, step))
+                    previous = decoded
+
+    def test_delta_needs_previous(self):
+        data = self.steps[0]
+        packed = ex.pack_array(data[1], data[0])
+        self.assertRaises(ValueError, ex.unpack_array, packed)
+
+    def test_shuffle_bytes(self):
+        buf = np.arange(12, dtype='>i4').tostring()
+        shuffled = ex.shuffle_bytes(buf, 4)
+        self.assertEqual(shuffled[:12], '\x00'*12)
+        self.assertEqual(ex.unshuffle_bytes(shuffled, 4), buf)
+
+    def test_quantize(self):
+        data = np.sin(np.linspace(0, 10, 1000))*100
+        for tolerance in (0.5, 1e-3, 1e-9):
+            codes = ex.quantize_array(data, tolerance)
+            self.assertTrue(codes.dtype.kind == 'i')
+            packed = ex.pack_array(codes, scale=2*tolerance)
+            decoded = ex.unpack_array(packed)
+            self.assertEqual(ex.packed_dtype(packed), np.float64)
+            self.assertTrue(np.abs(decoded - data).max() <= tolerance*(1 + 1e-9))
+        self.assertEqual(ex.quantize_array(data, 1e-9).dtype, np.int64)
+
+    def test_quantize_delta(self):
+        tolerance = 1e-4
+        steps = [np.sin(np.linspace(0, 1, 50) + 0.01*j) for j in xrange(4)]
+        previous = None
+        for step in steps:
+            codes = ex.quantize_array(step, tolerance)
+            packed = ex.pack_array(codes, ex.quantize_array(previous, tolerance)
+                if previous is not None else None, True, 2*tolerance)
+            decoded = ex.unpack_array(packed, previous)
+            self.assertTrue(np.abs(decoded - step).max() <= tolerance*(1 + 1e-9))
+            previous = decoded
+
+    def test_quantize_non_finite(self):
+        for bad in (np.nan, np.inf, 1e300):
+            data = np.array([1., bad, 2.])
+            self.assertRaises(ex.QuantizeError, ex.quantize_array, data, 1e-3)
+
+class PartBytesTest(TempDirTestCase):
+    def test_precision_word_size(self):
+        self.assertEqual(ex.precision_word_size(8), 8)
+        self.assertEqual(ex.precision_word_size(8, 'float32'), 4)
+        self.assertEqual(ex.precision_word_size(4, 'float64'), 8)
+        # the codes quantize_array gives for the largest value
+        self.assertEqual(ex.precision_word_size(8, quantize=1e-3, largest=100.), 4)
+        self.assertEqual(ex.quantize_array(np.array([100.]), 1e-3).dtype, np.int32)
+        self.assertEqual(ex.precision_word_size(8, quantize=1e-9, largest=100.), 8)
+        self.assertEqual(ex.quantize_array(np.array([100.]), 1e-9).dtype, np.int64)
+        self.assertEqual(ex.precision_word_size(8, quantize=1e-3), 8)
+        self.assertEqual(ex.precision_word_size(8, quantize=1e-3, largest=np.nan), 8)
+
+    def test_steps_for_part_bytes(self):
+        self.assertEqual(ex.steps_for_part_bytes(1000, 10, 2, 8), 6)
+        self.assertEqual(ex.steps_for_part_bytes(100, 10, 2, 8), 1)
+
+    def test_largest_node_value(self):
+        path, names = self.synthetic(num_nodes=20, num_time_steps=4)
+        f = ep.ExoFile(path)
+        values = np.abs(f.node_variable('VAR1')[:])
+        self.assertEqual(ex.largest_node_value(f, ['VAR1', 'MISSING'], [0, 3]),
+            values[[0, 3]].max())
+        self.assertEqual(ex.largest_node_value(f, ['MISSING'], [0]), None)
+
+class ManifestTest(TempDirTestCase):
+    def test_config(self):
+        source = {'bytes': 10, 'mtime': 1000}
+        config = ex.manifest_config(10, 'A, B', encoding='packed', workers=4,
+            source=source)
+        self.assertEqual(config['variables'], ['A', 'B'])
+        self.assertEqual(config['source'], source)
+        self.assertTrue('workers' not in config)
+        other = ex.manifest_config(10, 'A,B', encoding='packed',
+            source={'bytes': 10, 'mtime': 2000})
+        self.assertNotEqual(config, other)
+
+    def test_valid_files(self):
+        config = ex.manifest_config(10, 'A')
+        for name, data in [('a.seq', 'aaaa'), ('b.seq', 'bbbbbb')]:
+            f = open(os.path.join(self.tmpdir, name), 'wb')
+            f.write(data)
+            f.close()
+        files = dict([(name, ex.manifest_entry(os.path.join(self.tmpdir, name)))
+            for name in ('a.seq', 'b.seq')])
+        ex.write_manifest(self.tmpdir, config, files)
+        manifest = ex.read_manifest(self.tmpdir)
+        sizes = ex.local_sizes(self.tmpdir)
+        self.assertEqual(sorted(ex.valid_files(manifest, config, sizes)), ['a.seq', 'b.seq'])
+        self.assertEqual(ex.valid_files(manifest, ex.manifest_config(5, 'A'), sizes), {})
+        self.assertEqual(ex.valid_files(None, config, sizes), {})
+        sizes['a.seq'] = 3
+        self.assertEqual(sorted(ex.valid_files(manifest, config, sizes)), ['b.seq'])
+
+        # a local file of the same size but other bytes
+        f = open(os.path.join(self.tmpdir, 'b.seq'), 'wb')
+        f.write('bbbbbc')
+        f.close()
+        self.assertEqual(sorted(ex.valid_local_files(self.tmpdir, config)), ['a.seq'])
+
+    def test_parse_manifest(self):
+        self.assertEqual(ex.parse_manifest(''), None)
+        self.assertEqual(ex.parse_manifest('[1, 2]'), None)
+        self.assertEqual(ex.parse_manifest('{"files": {}}'), {'files': {}})
@@ -0,0 +1,139 @@
+import os
+import struct
+
+import numpy as np
+
+from support import TempDirTestCase
+import exopy2 as ep
+import netcdf3
+
+class NetCDFWriterTest(TempDirTestCase):
+    def write(self, name='test.nc'):
+        path = os.path.join(self.tmpdir, name)
+        w = netcdf3.NetCDFWriter(path)
+        w.create_dimension('time', None)
+        w.create_dimension('n', 3)
+        w.create_dimension('len', 5)
+        w.set_attribute('title', 'a test')
+        w.set_attribute('version', np.array([5.1], dtype=np.float32))
+        w.create_variable('names', 'c', ('n', 'len'))
+        w.create_variable('ids', 'i', ('n',), [('units', 'none')])
+        w.create_variable('flags', 'b', ('n',))
+        w.create_variable('t', 'd', ('time',))
+        w.create_variable('vals', 'f', ('time', 'n'))
+        w.create_variable('counts', 's', ('time', 'n'))
+        w.begin()
+        names = np.zeros((3, 5), dtype='S1')
+        for i, s in enumerate(['x', 'yy', 'zzzzz']):
+            names[i,:len(s)] = list(s)
+        w.put('names', names)
+        w.put('ids', [10, 20, 30])
+        w.put('flags', [1, -1, 0])
+        for j in xrange(4):
+            w.put('t', 0.5*j, record=j)
+            w.put('vals', np.arange(3) + j, record=j)
+            w.put('counts', np.arange(3) - j, record=j)
+        w.close()
+        return path
+
+    def test_round_trip(self):
+        cdf = netcdf3.NetCDFFile(self.write())
+        self.assertEqual(cdf.dimensions, {'time': None, 'n': 3, 'len': 5})
+        self.assertEqual(cdf.title, 'a test')
+        self.assertAlmostEqual(cdf.version[0], 5.1, places=6)
+        self.assertEqual(cdf.variables['ids'].units, 'none')
+        names = cdf.variables['names'].getValue()
+        self.assertEqual([row.tostring().rstrip('\x00') for row in names],
+            ['x', 'yy', 'zzzzz'])
+        self.assertEqual(cdf.variables['ids'].getValue().tolist(), [10, 20, 30])
+        self.assertEqual(cdf.variables['flags'].getValue().tolist(), [1, -1, 0])
+        self.assertEqual(cdf.variables['t'].getValue().tolist(), [0., 0.5, 1., 1.5])
+        vals = cdf.variables['vals'].getValue()
+        self.assertEqual(vals.shape, (4, 3))
+        self.assertEqual(vals.dtype, np.dtype('>f4'))
+        self.assertTrue(np.array_equal(vals, np.arange(3) + np.arange(4)[:,None]))
+        self.assertTrue(np.array_equal(cdf.variables['counts'][2], [-2, -1, 0]))
+
+    def test_single_record_variable_is_not_padded(self):
+        path = os.path.join(self.tmpdir, 'single.nc')
+        w = netcdf3.NetCDFWriter(path)
+        w.create_dimension('time', None)
+        w.create_dimension('n', 3)
+        w.create_variable('v', 's', ('time', 'n'))
+        w.begin()
+        for j in xrange(5):
+            w.put('v', [j, j, j], record=j)
+        w.close()
+        # magic and numrecs, the dimensions, no attributes, the variable:
+        # its name, the number and ids of its dimensions, no attributes,
+        # nc_type, vsize and begin
+        header = 8 + (8 + 2*(4 + 4 + 4)) + 8 + (8 + (4 + 4) + 4 + 2*4 + 8 + 4 + 4 + 4)
+        self.assertEqual(os.path.getsize(path), header + 5*6)
+        v = netcdf3.NetCDFFile(path).variables['v'].getValue()
+        self.assertTrue(np.array_equal(v, np.repeat(np.arange(5), 3).reshape(5, 3)))
+
+    def test_64bit_offsets_beyond_2GiB(self):
+        path = os.path.join(self.tmpdir, 'large.nc')
+        w = netcdf3.NetCDFWriter(path)
+        w.create_dimension('n', 300000000)
+        w.create_dimension('m', 2)
+        w.create_variable('big', 'd', ('n',))
+        w.create_variable('small', 'i', ('m',))
+        w.begin()
+        # the file is sparse, big is never written
+        w.put('small', [7, 8])
+        w.close()
+        f = open(path, 'rb')
+        try:
+            self.assertEqual(f.read(4), 'CDF\x02')
+        finally:
+            f.close()
+        cdf = netcdf3.NetCDFFile(path)
+        self.assertEqual(cdf.variables['small'].getValue().tolist(), [7, 8])
+
+    def test_put_checks_the_shape_and_the_record(self):
+        path = os.path.join(self.tmpdir, 'bad.nc')
+        w = netcdf3.NetCDFWriter(path)
+        w.create_dimension('time', None)
+        w.create_dimension('n', 3)
+        w.create_variable('v', 'd', ('time', 'n'))
+        w.begin()
+        self.assertRaises(ValueError, w.put, 'v', [1., 2., 3.])
+        self.assertRaises(ValueError, w.put, 'v', [1., 2.], 0)
+        w.close()
+
+    def test_not_netcdf3(self):
+        path = os.path.join(self.tmpdir, 'other.nc')
+        f = open(path, 'wb')
+        f.write('\x89HDF\r\n\x1a\n' + struct.pack('>i', 0))
+        f.close()
+        self.assertRaises(netcdf3.FormatError, netcdf3.NetCDFFile, path)
+
+class SyntheticExodusTest(TempDirTestCase):
+    def check(self, word_size):
+        path, names = self.synthetic(num_nodes=50, num_time_steps=7,
+            num_vars=3, word_size=word_size)
+        f = ep.ExoFile(path)
+        self.assertEqual(f.num_nodes, 50)
+        self.assertEqual(f.num_time_steps, 7)
+        self.assertEqual(f.num_dim, 3)
+        self.assertEqual(f.floating_point_word_size, word_size)
+        self.assertEqual(f.node_variable_names(), names)
+        self.assertEqual(f.coordinate_names(), ['x', 'y', 'z'])
+        self.assertEqual(f.info_records(), ['written by exopy2.write_synthetic'])
+        self.assertTrue(np.allclose(f.time_steps(), np.linspace(0., 1., 7)))
+        coords = np.random.RandomState(0).rand(3, 50)
+        for i, c in enumerate('xyz'):
+            self.assertTrue(np.allclose(f.vars['coord'+c].getValue(), coords[i]))
+        values = f.node_variable('VAR1')[:]
+        self.assertEqual(values.dtype.itemsize, word_size)
+        phase = coords[0]*2 + coords[1] + coords[2]
+        for j in xrange(7):
+            expect = np.sin(phase + 0.01*j) + 0.001*j
+            self.assertTrue(np.allclose(values[j], expect, atol=1e-6))
+
+    def test_float64(self):
+        self.check(8)
+
+    def test_float32(self):
+        self.check(4)
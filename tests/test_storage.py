@@ -0,0 +1,236 @@
+import os
+import shutil
+from StringIO import StringIO
+
+from support import TempDirTestCase, set_last_value
+import exodus2seq as ex
+import storage as st
+from exodus2seq_reader import Dataset
+
+def write(path, data):
+    f = open(path, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+class LocalStorageTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.root = os.path.join(self.tmpdir, 'root')
+        os.makedirs(os.path.join(self.root, 'data', 'sub'))
+        write(os.path.join(self.root, 'data', 'a.txt'), 'abc')
+        self.storage = st.open_storage('local', self.root)
+
+    def test_cat(self):
+        self.assertEqual(self.storage.cat('hdfs://namenode/data/a.txt'), 'abc')
+        self.assertEqual(self.storage.cat('/data/a.txt'), 'abc')
+        self.assertEqual(self.storage.cat('/data/missing.txt'), None)
+        self.assertEqual(self.storage.cat('/data'), None)
+
+    def test_status(self):
+        path = os.path.join(self.root, 'data', 'a.txt')
+        os.utime(path, (1000.5, 1000.5))
+        self.assertEqual(self.storage.status('/data/a.txt'),
+            {'bytes': 3, 'mtime': 1000500})
+        self.assertEqual(self.storage.status('/data/missing.txt'), None)
+        # the same identity the manifest records for a local input
+        self.assertEqual(self.storage.status('hdfs:///data/a.txt'),
+            ex.source_info(path))
+
+    def test_sizes(self):
+        # the subdirectory is not a file
+        self.assertEqual(self.storage.sizes('/data'), {'a.txt': 3})
+        self.assertEqual(self.storage.sizes('/missing'), None)
+
+    def test_get(self):
+        local = os.path.join(self.tmpdir, 'a.txt')
+        self.storage.get('hdfs://namenode/data/a.txt', local)
+        self.assertEqual(open(local).read(), 'abc')
+
+    def test_put_dir(self):
+        localdir = os.path.join(self.tmpdir, 'local')
+        os.mkdir(localdir)
+        for name, data in [('x.seq', 'x'), ('y.seq', 'yy'), ('z.seq', 'zzz')]:
+            write(os.path.join(localdir, name), data)
+        self.storage.put_dir(localdir, '/out/new', ['y.seq', 'x.seq'])
+        self.assertEqual(self.storage.sizes('/out/new'), {'x.seq': 1, 'y.seq': 2})
+        write(os.path.join(localdir, 'x.seq'), 'xxxx')
+        self.storage.put_dir(localdir, '/out/new')
+        self.assertEqual(self.storage.sizes('/out/new'),
+            {'x.seq': 4, 'y.seq': 2, 'z.seq': 3})
+
+    def test_delete(self):
+        self.storage.delete('/data/a.txt')
+        self.assertEqual(self.storage.sizes('/data'), {})
+        self.storage.delete('/data')
+        self.assertEqual(self.storage.sizes('/data'), None)
+        self.storage.delete('/data')
+
+    def test_open_storage(self):
+        self.assertTrue(isinstance(st.open_storage('shell'), st.HadoopShellStorage))
+        self.assertTrue(isinstance(st.open_storage('webhdfs', 'http://nn:50070'),
+            st.WebHDFSStorage))
+        self.assertRaises(ValueError, st.open_storage, 'webhdfs')
+        self.assertRaises(ValueError, st.open_storage, 'ftp')
+
+class InterruptedStorage(st.LocalStorage):
+    """ A LocalStorage whose uploads stop after the manifest. """
+    def put_dir(self, localdir, dirname, fnames=None):
+        copyfile = shutil.copyfile
+        def copy_manifest(src, dst):
+            if os.path.basename(src) != ex.MANIFEST_FILE:
+                raise IOError('interrupted')
+            copyfile(src, dst)
+        shutil.copyfile = copy_manifest
+        try:
+            st.LocalStorage.put_dir(self, localdir, dirname, fnames)
+        finally:
+            shutil.copyfile = copyfile
+
+class HadoopJobTest(TempDirTestCase):
+    """ The mapper of the Hadoop job with the local storage as the
+    cluster. """
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.root = os.path.join(self.tmpdir, 'root')
+        os.makedirs(os.path.join(self.root, 'in'))
+        self.paths = []
+        for i in xrange(3):
+            path, names = self.synthetic(num_nodes=40, num_time_steps=10,
+                name=os.path.join('root', 'in', 'f%i.e'%(i)))
+            self.paths.append(path)
+        # the mapper works in the current directory, as in a task
+        self.cwd = os.getcwd()
+        self.workdir = os.path.join(self.tmpdir, 'work')
+        os.mkdir(self.workdir)
+        os.chdir(self.workdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        TempDirTestCase.tearDown(self)
+
+    def job(self, *args):
+        import mr_exodus2seq_hadoop as mr
+        job = mr.MRExodus2Seq(['--storage', 'local', '--storage-url', self.root,
+            '-t', '4', '--variables', 'VAR0,VAR1', '-d', 'hdfs:///out',
+            '--encoding', 'packed'] + list(args))
+        job.stderr = StringIO()
+        return job
+
+    def lines(self):
+        return ['%i\thdfs:///in/f%i.e'%(i, i) for i in xrange(len(self.paths))]
+
+    def run_mapper(self, job):
+        job.mapper_init()
+        output = []
+        for line in self.lines():
+            output.extend(job.mapper(None, line))
+        output.extend(job.mapper_final() or [])
+        return output
+
+    def counters(self, job):
+        """ The counters the job reported, summed by name. """
+        counters = {}
+        for line in job.stderr.getvalue().splitlines():
+            if line.startswith('reporter:counter:'):
+                group, name, amount = line[len('reporter:counter:'):].split(',')
+                counters[name] = counters.get(name, 0) + int(amount)
+        return counters
+
+    def dataset(self, i):
+        return Dataset(os.path.join(self.root, 'out', 'f%i'%(i)))
+
+    def check_output(self, output):
+        self.assertEqual(output, [('hdfs:///in/f%i.e'%(i), 0)
+            for i in xrange(len(self.paths))])
+        for i in xrange(len(self.paths)):
+            ds = self.dataset(i)
+            self.assertEqual(len(ds.parts), 3)
+            self.assertEqual(ds.get_step(9)[0], 1.)
+        # the local files are gone
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_mapper(self):
+        job = self.job()
+        self.check_output(self.run_mapper(job))
+        self.assertEqual(self.counters(job)['parts'], 9)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'out', 'f0'))),
+            ['_manifest.json', '_offsets.seq', 'f0_part0.seq', 'f0_part1.seq',
+            'f0_part2.seq', 'index.seq'])
+
+    def test_pipeline(self):
+        job = self.job('--pipeline', '--max-local-bytes', '1')
+        self.check_output(self.run_mapper(job))
+        self.assertEqual(self.counters(job)['parts'], 9)
+        status = [line for line in job.stderr.getvalue().splitlines()
+            if line.startswith('reporter:status:done')]
+        self.assertEqual(len(status), 3)
+
+    def test_pipeline_same_file_names(self):
+        # two inputs named f1.e, the second one is the last uploaded
+        os.mkdir(os.path.join(self.root, 'in', 'b'))
+        other = os.path.join(self.root, 'in', 'b', 'f1.e')
+        shutil.copyfile(self.paths[1], other)
+        set_last_value(other, 42.)
+        job = self.job('--pipeline')
+        job.mapper_init()
+        lines = self.lines() + ['3\thdfs:///in/b/f1.e']
+        for line in lines:
+            list(job.mapper(None, line))
+        output = list(job.mapper_final())
+        self.assertEqual(output, [(line.split('\t')[1], 0) for line in lines])
+        self.assertEqual(self.counters(job)['parts'], 12)
+        self.assertEqual(dict(self.dataset(1).get_step(9)[1])['VAR1'][-1], 42.)
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_rerun_skips_converted_files(self):
+        self.run_mapper(self.job())
+        job = self.job()
+        self.check_output(self.run_mapper(job))
+        self.assertEqual(self.counters(job)['files_skipped'], 3)
+
+    def test_rerun_converts_changed_files(self):
+        self.run_mapper(self.job())
+        set_last_value(self.paths[1], 42.)
+        job = self.job('--pipeline')
+        self.check_output(self.run_mapper(job))
+        counters = self.counters(job)
+        self.assertEqual(counters['files_skipped'], 2)
+        self.assertEqual(counters['parts_kept'], 0)
+        self.assertEqual(dict(self.dataset(1).get_step(9)[1])['VAR1'][-1], 42.)
+
+    def test_interrupted_upload_of_a_changed_file(self):
+        # the old and the new parts have the same sizes
+        self.run_mapper(self.job('--compression', 'none'))
+        set_last_value(self.paths[1], 42.)
+        job = self.job('--compression', 'none')
+        job.storage = InterruptedStorage(self.root)
+        self.assertRaises(IOError, self.run_mapper, job)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'out', 'f1'))),
+            [ex.MANIFEST_FILE])
+        # the next attempt of the task starts in an empty directory
+        os.chdir(self.tmpdir)
+        shutil.rmtree(self.workdir)
+        os.mkdir(self.workdir)
+        os.chdir(self.workdir)
+        job = self.job('--compression', 'none')
+        self.check_output(self.run_mapper(job))
+        self.assertEqual(self.counters(job)['files_skipped'], 2)
+        self.assertEqual(dict(self.dataset(1).get_step(9)[1])['VAR1'][-1], 42.)
+
+    def test_incomplete_upload_is_converted_again(self):
+        self.run_mapper(self.job())
+        dsdir = os.path.join(self.root, 'out', 'f0')
+        # killed before the offsets index made it
+        os.remove(os.path.join(dsdir, ex.OFFSETS_FILE))
+        # a partial write of index.seq
+        f = open(os.path.join(os.path.join(self.root, 'out', 'f2'), 'index.seq'), 'r+b')
+        f.truncate(10)
+        f.close()
+        job = self.job()
+        self.check_output(self.run_mapper(job))
+        counters = self.counters(job)
+        self.assertEqual(counters['files_skipped'], 1)
+        self.assertEqual(counters['parts_kept'], 6)
+        self.assertTrue(self.dataset(0).parts[0].offsets)